@@ -8,6 +8,8 @@ import importlib
 from collections import deque
 from typing import Dict, Optional, List, Tuple, Type
 
+import aiohttp
+
 from astrbot.api.event import filter, AstrMessageEvent
 from astrbot.api.star import Context, Star, StarTools
 from astrbot.api import logger
@@ -318,6 +320,14 @@ class QQToolsPlugin(Star):
         # Poke notice 缓存：存储最近的 poke notice 事件，用于 PokeTool 获取戳一戳文案
         # 使用全局缓存而非 session 级别，因为 poke notice 的 session_id 可能与触发工具的 session_id 不同
         self.poke_notice_cache: deque = deque(maxlen=20)  # 只保留最近 20 条
+
+        # 持有内部缓存的工具实例（实现了 prune_caches 方法），由缓存清理任务定期清理过期条目
+        self._cache_owners: List[FunctionTool] = []
+
+        # 工具共享的 HTTP 会话（懒创建），复用连接池避免每次请求重新握手
+        self._http_session: Optional[aiohttp.ClientSession] = None
+        # 工具提交的后台任务（如上传文件的清理请求），插件关闭时等待其完成
+        self._background_tasks: set = set()
         
         logger.info(f"QQToolsPlugin loaded. Cache size: {self.cache_size}, inactive timeout: {self.cache_inactive_timeout}s.")
 
@@ -378,6 +388,9 @@ class QQToolsPlugin(Star):
         
         # 修改工具实例的名称为当前配置
         tool_instance.name = current_name
+
+        if callable(getattr(tool_instance, "prune_caches", None)):
+            self._cache_owners.append(tool_instance)
         
         if self.tool_config.get(key, default):
             # 注册当前版本的工具
@@ -544,7 +557,9 @@ class QQToolsPlugin(Star):
             # 使用官方 API 获取插件专属数据目录
             data_dir = str(StarTools.get_data_dir())
             
-            self.wake_scheduler = WakeScheduler(self.context, data_dir)
+            self.wake_scheduler = WakeScheduler(
+                self.context, data_dir, fsync=self.tool_config.get("wake_fsync", True)
+            )
             self.wake_scheduler.set_wake_callback(self._wake_callback)
             
             # 启动初始化任务
@@ -888,6 +903,40 @@ class QQToolsPlugin(Star):
         except Exception as e:
             logger.debug(f"Error cleaning up browser: {e}")
 
+        # 等待后台任务完成（它们可能仍在使用共享 HTTP 会话）
+        if self._background_tasks:
+            await asyncio.wait(list(self._background_tasks), timeout=10)
+        
+        # 关闭共享 HTTP 会话
+        if self._http_session and not self._http_session.closed:
+            try:
+                await self._http_session.close()
+            except Exception as e:
+                logger.debug(f"Error closing http session: {e}")
+        self._http_session = None
+
+    def create_background_task(self, coro) -> asyncio.Task:
+        """提交无需等待结果的后台任务，并持有其引用直到完成"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
+    def get_http_session(self) -> aiohttp.ClientSession:
+        """获取工具共享的 aiohttp 会话，不存在或已关闭时重新创建
+
+        各请求自行传入 timeout；不保存 Cookie，避免不同请求之间互相影响。
+        """
+        if self._http_session is None or self._http_session.closed:
+            self._http_session = aiohttp.ClientSession(
+                # 限制单个主机的并发连接，避免并发工具调用时集中压向 Gemini/B站 等同一主机
+                connector=aiohttp.TCPConnector(
+                    limit=100, limit_per_host=20, ttl_dns_cache=300, keepalive_timeout=75
+                ),
+                cookie_jar=aiohttp.DummyCookieJar(),
+            )
+        return self._http_session
+
     def _get_session_cache(self, session_id: str) -> deque:
         """获取或创建会话缓存，同时更新最后活跃时间
         
@@ -906,14 +955,12 @@ class QQToolsPlugin(Star):
         return self.message_cache[session_id]
     
     async def _cleanup_inactive_caches_loop(self):
-        """后台任务：定期清理不活跃的会话缓存
+        """后台任务：定期清理不活跃的会话缓存，以及各工具内部的过期缓存
         
-        如果 cache_inactive_timeout 为 0 或负数，则禁用自动清理。
+        如果 cache_inactive_timeout 为 0 或负数，则不再清理会话缓存，但工具缓存仍会按间隔清理。
         """
-        # 如果禁用了自动清理，直接退出
         if self.cache_inactive_timeout <= 0:
             logger.debug("Cache auto-cleanup disabled (cache_inactive_timeout <= 0).")
-            return
         
         # 确保清理间隔有效
         cleanup_interval = max(self.cache_cleanup_interval, 60)  # 最小 60 秒
@@ -922,12 +969,21 @@ class QQToolsPlugin(Star):
             try:
                 await asyncio.sleep(cleanup_interval)
                 await self._cleanup_inactive_caches()
+                self._prune_tool_caches()
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 logger.error(f"Error in cache cleanup loop: {e}")
                 await asyncio.sleep(cleanup_interval)
     
+    def _prune_tool_caches(self):
+        """清理各工具内部缓存中已过期或超出容量的条目"""
+        for tool in self._cache_owners:
+            try:
+                tool.prune_caches()
+            except Exception as e:
+                logger.debug(f"Error pruning caches of tool {tool.name}: {e}")
+
     async def _cleanup_inactive_caches(self):
         """清理不活跃的会话缓存
         
@@ -2256,9 +2312,9 @@ class QQToolsPlugin(Star):
         success = await self.wake_scheduler.delete_task(task_id=task_id)
         
         if success:
-            yield event.plain_result(f"✅ 已删除唤醒任务: {task_id[:8]}...")
+            yield event.plain_result(f"✅ 已删除唤醒任务: {task_id}")
         else:
-            yield event.plain_result(f"❌ 未找到任务: {task_id[:8]}...")
+            yield event.plain_result(f"❌ 未找到任务: {task_id}")
     
     @filter.permission_type(filter.PermissionType.ADMIN)
     @qts_wk.command("clear")
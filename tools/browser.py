@@ -1135,35 +1135,35 @@ class BrowserSendImageTool(FunctionTool):
     async def _download_image(self, url: str, timeout: int = 30) -> Optional[bytes]:
         """下载图片"""
         try:
-            async with aiohttp.ClientSession() as session:
-                headers = {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
-                    'Referer': browser_manager.page.url if browser_manager.page else '',
-                }
+            session = self.plugin.get_http_session()
+            headers = {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+                'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
+                'Referer': browser_manager.page.url if browser_manager.page else '',
+            }
                 
-                async with session.get(
-                    url,
-                    headers=headers,
-                    timeout=aiohttp.ClientTimeout(total=timeout)
-                ) as resp:
-                    if resp.status != 200:
-                        logger.warning(f"Failed to download image: HTTP {resp.status} - {url}")
-                        return None
+            async with session.get(
+                url,
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=timeout)
+            ) as resp:
+                if resp.status != 200:
+                    logger.warning(f"Failed to download image: HTTP {resp.status} - {url}")
+                    return None
                     
-                    # 检查内容类型
-                    content_type = resp.headers.get('Content-Type', '')
-                    if not content_type.startswith('image/'):
-                        logger.warning(f"Not an image content type: {content_type} - {url}")
-                        # 仍然尝试返回内容，因为有些服务器可能返回错误的Content-Type
+                # 检查内容类型
+                content_type = resp.headers.get('Content-Type', '')
+                if not content_type.startswith('image/'):
+                    logger.warning(f"Not an image content type: {content_type} - {url}")
+                    # 仍然尝试返回内容，因为有些服务器可能返回错误的Content-Type
                     
-                    # 检查文件大小（限制50MB）
-                    content_length = resp.headers.get('Content-Length')
-                    if content_length and int(content_length) > 50 * 1024 * 1024:
-                        logger.warning(f"Image too large: {content_length} bytes - {url}")
-                        return None
+                # 检查文件大小（限制50MB）
+                content_length = resp.headers.get('Content-Length')
+                if content_length and int(content_length) > 50 * 1024 * 1024:
+                    logger.warning(f"Image too large: {content_length} bytes - {url}")
+                    return None
                     
-                    return await resp.read()
+                return await resp.read()
                     
         except asyncio.TimeoutError:
             logger.warning(f"Timeout downloading image: {url}")
@@ -357,13 +357,13 @@ class GetMessageDetailTool(FunctionTool):
         """
         try:
             # 下载图片（异步）
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=aiohttp.ClientTimeout(total=30)) as resp:
-                    if resp.status != 200:
-                        return None, f"下载失败: HTTP {resp.status}"
+            session = self.plugin.get_http_session()
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=30)) as resp:
+                if resp.status != 200:
+                    return None, f"下载失败: HTTP {resp.status}"
                     
-                    content_type = resp.headers.get('Content-Type', '').split(';')[0].strip().lower()
-                    image_data = await resp.read()
+                content_type = resp.headers.get('Content-Type', '').split(';')[0].strip().lower()
+                image_data = await resp.read()
             
             # 检测实际的图片格式
             detected_format = self._detect_image_format(image_data)
@@ -1,3 +1,5 @@
+import asyncio
+
 from astrbot.api import logger
 from astrbot.core.platform.sources.aiocqhttp.aiocqhttp_message_event import AiocqhttpMessageEvent
 from astrbot.core.agent.tool import FunctionTool, ToolExecResult
@@ -6,6 +8,14 @@ from astrbot.core.astr_agent_context import AstrAgentContext
 from ..utils import call_onebot, check_tool_permission, get_original_tool_name
 
 
+# 角色名称映射
+_ROLE_MAP = {
+    "owner": "群主",
+    "admin": "管理员",
+    "member": "成员"
+}
+
+
 def get_qq_title_display_length(text: str) -> str:
     """计算 QQ 头衔的显示字数描述
     
@@ -99,36 +109,53 @@ class SetSpecialTitleTool(FunctionTool):
 
         group_id = event.message_obj.group_id
         client = event.bot
-        
-        # 角色名称映射
-        role_map = {
-            "owner": "群主",
-            "admin": "管理员",
-            "member": "成员"
-        }
 
         try:
             # 1. 获取机器人自己的身份
             login_info = await call_onebot(client, 'get_login_info')
             bot_id = str(login_info.get('user_id'))
             
-            bot_member_info = await call_onebot(client, 'get_group_member_info', group_id=group_id, user_id=int(bot_id), no_cache=True)
-            bot_role = bot_member_info.get('role', 'member')
-            bot_role_cn = role_map.get(bot_role, bot_role)
+            # 目标 QQ 号无效时不查询目标用户，错误在群主检查之后返回
+            try:
+                target_uid = int(qq_id)
+            except (TypeError, ValueError) as e:
+                target_uid = None
+                target_error = e
+            
+            # 2. 并发获取群信息与目标用户信息
+            # 部分 OneBot 实现的 get_group_info 会返回 owner_id，可省去查询机器人群成员信息的请求
+            lookups = [call_onebot(client, 'get_group_info', group_id=group_id)]
+            if target_uid is not None:
+                lookups.append(call_onebot(client, 'get_group_member_info', group_id=group_id, user_id=target_uid, no_cache=True))
+            results = await asyncio.gather(*lookups, return_exceptions=True)
+            group_info = results[0]
+            target_member_info = results[1] if target_uid is not None else target_error
             
-            # 2. 检查机器人是否是群主（只有群主才能设置头衔）
-            if bot_role != 'owner':
-                return f"设置头衔失败：权限不足。只有群主才能设置专属头衔，当前机器人身份为「{bot_role_cn}」。"
+            owner_id = group_info.get('owner_id') if isinstance(group_info, dict) else None
+            if owner_id:
+                # 已知群主时无需再查询机器人的群成员信息
+                if str(owner_id) != bot_id:
+                    return "设置头衔失败：权限不足。只有群主才能设置专属头衔，当前机器人不是群主。"
+            else:
+                # 未返回 owner_id 时，查询机器人自己的群成员身份
+                bot_member_info = await call_onebot(client, 'get_group_member_info', group_id=group_id, user_id=int(bot_id), no_cache=True)
+                bot_role = bot_member_info.get('role', 'member')
+                
+                # 3. 检查机器人是否是群主（只有群主才能设置头衔）
+                if bot_role != 'owner':
+                    bot_role_cn = _ROLE_MAP.get(bot_role, bot_role)
+                    return f"设置头衔失败：权限不足。只有群主才能设置专属头衔，当前机器人身份为「{bot_role_cn}」。"
             
-            # 3. 获取目标用户信息
+            # 4. 检查目标用户信息
             try:
-                target_member_info = await call_onebot(client, 'get_group_member_info', group_id=group_id, user_id=int(qq_id), no_cache=True)
+                if isinstance(target_member_info, BaseException):
+                    raise target_member_info
                 target_nickname = target_member_info.get('card') or target_member_info.get('nickname') or str(qq_id)
-                old_title = target_member_info.get('title', '') or ''
+                old_title = target_member_info.get('title') or ''
             except Exception as e:
                 return f"获取目标用户信息失败：{e}。可能该用户不在本群中。"
             
-            # 4. 执行设置头衔操作
+            # 5. 执行设置头衔操作
             # OneBot API: set_group_special_title
             # 参数：group_id, user_id, special_title, duration (可选，-1为永久)
             try:
@@ -136,7 +163,7 @@ class SetSpecialTitleTool(FunctionTool):
                     client, 
                     'set_group_special_title', 
                     group_id=group_id, 
-                    user_id=int(qq_id),
+                    user_id=target_uid,
                     special_title=new_title,
                     duration=-1  # 永久
                 )
@@ -152,7 +179,7 @@ class SetSpecialTitleTool(FunctionTool):
                 else:
                     return f"设置头衔失败：{e}"
             
-            # 5. 构建成功返回消息
+            # 6. 构建成功返回消息
             title_len_desc = get_qq_title_display_length(new_title)
             
             if new_title:
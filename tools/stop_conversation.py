@@ -1,8 +1,9 @@
-import json
+from astrbot.core import logger
 from astrbot.core.agent.tool import FunctionTool, ToolExecResult
 from astrbot.core.agent.run_context import ContextWrapper
 from astrbot.core.astr_agent_context import AstrAgentContext
 from astrbot.core.provider.entities import ProviderRequest
+from ..utils import json_loads
 
 class StopConversationTool(FunctionTool):
     def __init__(self):
@@ -31,7 +32,7 @@ class StopConversationTool(FunctionTool):
                 
                 # 重新解析完整的历史记录 (req.contexts 可能是被截断的)
                 # 使用 req.conversation.history 确保我们不会丢失早期的上下文
-                messages = json.loads(req.conversation.history) if req.conversation.history else []
+                messages = json_loads(req.conversation.history) if req.conversation.history else []
                 
                 # 追加当前用户的消息
                 messages.append(await req.assemble_context())
@@ -50,7 +51,6 @@ class StopConversationTool(FunctionTool):
                 )
             except Exception as e:
                 # 记录错误但不中断流程
-                from astrbot.core import logger
                 logger.error(f"Failed to save conversation history in stop_conversation: {e}")
 
         # 返回 None，触发 Agent Runner 结束任务 (Transition to DONE state)
@@ -1,4 +1,9 @@
+import re
 import base64
+import time
+import asyncio
+from collections import OrderedDict
+
 import aiohttp
 from astrbot.api import logger
 from astrbot.core.platform.sources.aiocqhttp.aiocqhttp_message_event import AiocqhttpMessageEvent
@@ -7,7 +12,19 @@ from astrbot.core.agent.run_context import ContextWrapper
 from astrbot.core.astr_agent_context import AstrAgentContext
 from astrbot.core.agent.message import ImageURLPart
 from astrbot.core.provider.provider import Provider
-from ..utils import call_onebot
+from ..utils import call_onebot, ensure_list_content
+
+
+_NON_DIGIT_RE = re.compile(r'\D+')
+
+# 腾讯官方头像接口，s 为图片边长（640 为高清）
+_AVATAR_URL_TMPL = "https://q1.qlogo.cn/g?b=qq&nk={uid}&s={size}"
+
+# 头像图片组件缓存上限（按 LRU 淘汰）
+_AVATAR_PART_CACHE_MAX = 128
+
+# describe 模式下头像描述的缓存有效期（秒）
+_DESCRIBE_CACHE_TTL = 3600
 
 
 class ViewAvatarTool(FunctionTool):
@@ -28,6 +45,14 @@ class ViewAvatarTool(FunctionTool):
         )
         self.plugin = plugin_instance
         self.config = self.plugin.config.get("view_avatar_config", {})
+        self.avatar_size = self.config.get("avatar_size", 640)
+        # URL 注入模式下的图片组件缓存: {avatar_url: ImageURLPart}
+        self._avatar_part_cache: OrderedDict[str, ImageURLPart] = OrderedDict()
+        # describe 模式下进行中的模型请求: {(provider_id, user_id): Task}
+        # 同一用户的并发调用共享同一次请求，避免重复调用模型
+        self._inflight: dict[tuple[str, str], asyncio.Task] = {}
+        # describe 模式下的描述结果缓存: {(provider_id, user_id, avatar_url): (description, expire_at)}
+        self._describe_cache: dict[tuple[str, str, str], tuple[str, float]] = {}
 
     async def call(self, context: ContextWrapper[AstrAgentContext], **kwargs) -> ToolExecResult:
         qq_id = kwargs.get("qq_id")
@@ -51,13 +76,15 @@ class ViewAvatarTool(FunctionTool):
                 logger.error(f"Failed to get bot login info: {e}")
                 return f"获取BOT信息失败: {e}"
         
-        # 提取纯数字
-        user_id = "".join([c for c in str(user_id) if c.isdigit()])
+        # 常见情况为纯数字，直接使用；否则回退为提取其中的数字
+        user_id = str(user_id)
+        if not user_id.isdigit():
+            user_id = _NON_DIGIT_RE.sub('', user_id)
         if not user_id:
             return "❌ 获取失败：无法识别有效的QQ号。"
 
-        # 2. 构造高清头像 URL (腾讯官方接口，s=640为高清)
-        avatar_url = f"https://q1.qlogo.cn/g?b=qq&nk={user_id}&s=640"
+        # 2. 构造头像 URL
+        avatar_url = _AVATAR_URL_TMPL.format(uid=user_id, size=self.avatar_size)
 
         # 3. 根据配置选择查看方式
         view_mode = self.config.get("view_mode", "context")
@@ -76,19 +103,43 @@ class ViewAvatarTool(FunctionTool):
             (data_url, None) on success, (None, error_message) on failure
         """
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=aiohttp.ClientTimeout(total=15)) as resp:
-                    if resp.status != 200:
-                        return None, f"HTTP {resp.status}"
-                    content_type = resp.content_type or "image/png"
-                    if not content_type.startswith("image/"):
-                        content_type = "image/png"
-                    image_data = await resp.read()
+            session = self.plugin.get_http_session()
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=15)) as resp:
+                if resp.status != 200:
+                    return None, f"HTTP {resp.status}"
+                content_type = resp.content_type or "image/png"
+                if not content_type.startswith("image/"):
+                    content_type = "image/png"
+                image_data = await resp.read()
             b64 = base64.b64encode(image_data).decode("utf-8")
             return f"data:{content_type};base64,{b64}", None
         except Exception as e:
             return None, str(e)
 
+    def _get_image_part(self, user_id: str, img_url: str, cacheable: bool = True) -> ImageURLPart:
+        """获取头像图片组件，URL 形式的组件按 LRU 复用
+
+        base64 形式的组件内容随头像变化且体积较大，不进入缓存。
+        """
+        if cacheable:
+            cached = self._avatar_part_cache.get(img_url)
+            if cached is not None:
+                self._avatar_part_cache.move_to_end(img_url)
+                return cached
+
+        img_part = ImageURLPart(
+            image_url=ImageURLPart.ImageURL(
+                url=img_url,
+                id=f"avatar_{user_id}"
+            )
+        )
+
+        if cacheable:
+            self._avatar_part_cache[img_url] = img_part
+            if len(self._avatar_part_cache) > _AVATAR_PART_CACHE_MAX:
+                self._avatar_part_cache.popitem(last=False)
+        return img_part
+
     async def _inject_to_context(self, context: ContextWrapper[AstrAgentContext], user_id: str, avatar_url: str) -> str:
         """将头像图片注入到 LLM 上下文中"""
         try:
@@ -108,24 +159,15 @@ class ViewAvatarTool(FunctionTool):
                     img_url = avatar_url
 
                 # 构造一个图片组件
-                img_part = ImageURLPart(
-                    image_url=ImageURLPart.ImageURL(
-                        url=img_url,
-                        id=f"avatar_{user_id}"
-                    )
-                )
+                img_part = self._get_image_part(user_id, img_url, cacheable=img_url == avatar_url)
                 
                 # 查找最近的一条 User 消息，将图片追加进去
                 found_user_msg = False
-                for msg in reversed(messages):
+                for i in range(len(messages) - 1, -1, -1):
+                    msg = messages[i]
                     if msg.role == "user":
-                        # 确保 content 是列表以便追加
-                        if isinstance(msg.content, str):
-                            from astrbot.core.agent.message import TextPart
-                            msg.content = [TextPart(text=msg.content)]
-                        
-                        # 追加图片
-                        if isinstance(msg.content, list):
+                        # 确保 content 是列表以便追加，再追加图片
+                        if ensure_list_content(msg):
                             msg.content.append(img_part)
                             found_user_msg = True
                             logger.info(f"已将头像 {user_id} 注入到 LLM 上下文中。")
@@ -154,6 +196,47 @@ class ViewAvatarTool(FunctionTool):
             f"不要向用户展示 URL。"
         )
 
+    async def _text_chat_coalesced(self, key: tuple[str, str], provider: Provider, prompt: str, avatar_url: str):
+        """调用模型描述头像，相同 key 的并发请求合并为一次"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(provider.text_chat(
+                prompt=prompt,
+                image_urls=[avatar_url],
+            ))
+            self._inflight[key] = task
+
+            def _on_done(t: asyncio.Task):
+                if self._inflight.get(key) is t:
+                    del self._inflight[key]
+                # 标记异常已取回，避免所有调用方都被取消时产生警告
+                if not t.cancelled():
+                    t.exception()
+
+            task.add_done_callback(_on_done)
+        else:
+            logger.debug(f"复用进行中的头像描述请求: {key}")
+
+        # shield: 单个调用方被取消时不影响其他等待同一请求的调用方
+        return await asyncio.shield(task)
+
+    def prune_caches(self):
+        """清理过期的头像描述缓存，并将图片组件缓存限制在容量以内
+
+        由插件的缓存清理任务定期调用。
+        """
+        now = time.monotonic()
+        expired = [k for k, (_, expire_at) in self._describe_cache.items() if expire_at <= now]
+        for k in expired:
+            del self._describe_cache[k]
+
+        while len(self._avatar_part_cache) > _AVATAR_PART_CACHE_MAX:
+            self._avatar_part_cache.popitem(last=False)
+
+    def _store_description(self, key: tuple[str, str, str], description: str):
+        """写入头像描述缓存"""
+        self._describe_cache[key] = (description, time.monotonic() + _DESCRIBE_CACHE_TTL)
+
     async def _describe_avatar(self, context: ContextWrapper[AstrAgentContext], user_id: str, avatar_url: str) -> str:
         """使用指定的模型描述头像图片"""
         provider_id = self.config.get("describe_provider_id", "")
@@ -177,16 +260,25 @@ class ViewAvatarTool(FunctionTool):
             if not isinstance(provider, Provider):
                 return f"❌ 配置错误：{provider_id} 不是一个文本生成模型。\n💡 提示: 请配置一个支持图片输入的 Chat Completion 类型模型。"
             
+            cache_key = (provider_id, user_id, avatar_url)
+            cached = self._describe_cache.get(cache_key)
+            if cached is not None and cached[1] > time.monotonic():
+                logger.debug(f"命中头像描述缓存: {user_id}")
+                return (
+                    f"✅ 已成功获取并分析用户 {user_id} 的头像。\n\n"
+                    f"【头像描述】\n{cached[0]}"
+                )
+
             logger.info(f"使用 {provider_id} 描述头像: {avatar_url}")
             
             # 调用 LLM 进行图像描述
-            llm_response = await provider.text_chat(
-                prompt=prompt,
-                image_urls=[avatar_url],
+            llm_response = await self._text_chat_coalesced(
+                (provider_id, user_id), provider, prompt, avatar_url
             )
             
             if llm_response and llm_response.completion_text:
                 description = llm_response.completion_text
+                self._store_description(cache_key, description)
                 return (
                     f"✅ 已成功获取并分析用户 {user_id} 的头像。\n\n"
                     f"【头像描述】\n{description}"
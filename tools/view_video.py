@@ -4,13 +4,15 @@ import re
 import json
 import time
 import base64
+import random
 import shutil
 import aiohttp
 import asyncio
 import hashlib
-import traceback
+import logging
+import mmap
 import urllib.parse
-from functools import reduce
+from functools import lru_cache
 from typing import Optional, Dict, Tuple
 
 from astrbot.api import logger
@@ -19,7 +21,259 @@ from astrbot.core.agent.tool import FunctionTool, ToolExecResult
 from astrbot.core.agent.run_context import ContextWrapper
 from astrbot.core.astr_agent_context import AstrAgentContext
 from astrbot.core.utils.astrbot_path import get_astrbot_data_path
-from ..utils import call_onebot, check_tool_permission, get_original_tool_name
+from ..utils import call_onebot, check_tool_permission, get_original_tool_name, json_loads, json_dumps
+
+# pybase64 为可选依赖，安装后使用 SIMD 加速的 base64 编解码，未安装时回退到标准库
+try:
+    import pybase64 as _b64
+except ImportError:
+    _b64 = base64
+
+# 下载视频时每次读取的块大小
+_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# 分块解码 base64 视频时每块的字符数（须为 4 的倍数）
+_B64_DECODE_BLOCK = 4 * 1024 * 1024
+_B64_WHITESPACE = str.maketrans("", "", " \t\r\n")
+
+# inlineData 方式上传时 Base64 数据的大小上限（Gemini 限制单次请求约 20MB）
+_INLINE_MAX_BYTES = 20 * 1024 * 1024
+
+# 流式编码 inline 视频时每次读取的字节数（须为 3 的倍数，保证各块编码结果可直接拼接）
+_B64_ENCODE_BLOCK = 3 * 256 * 1024
+
+# 下载缓冲区池的容量：网络数据先拷入复用的缓冲区，攒满后再写盘
+_BUF_POOL_MAX = 4
+_buf_pool: list = []
+
+# File API 分块上传时单个数据块的最大重试次数
+_UPLOAD_CHUNK_RETRIES = 3
+
+# File API 上传文件的保留时长（秒），Gemini 会在 48 小时后自动删除
+_FILE_API_TTL = 48 * 3600
+
+# B站视频元信息（含播放地址）的缓存有效期（秒）
+_BILI_META_CACHE_TTL = 600
+
+# 已下载的 B站视频文件在磁盘缓存中的有效期（秒）
+_BILI_FILE_CACHE_TTL = 86400
+
+# b23.tv 短链解析结果的缓存有效期（秒）与上限（超出时淘汰最早写入的条目）
+_SHORT_LINK_CACHE_TTL = 600
+_SHORT_LINK_CACHE_MAX = 1024
+
+# B站 WBI 签名密钥的缓存有效期（秒），密钥每天轮换
+_WBI_KEYS_TTL = 6 * 3600
+
+# WBI 签名的 mixin key 重排表，以及签名前需要从参数值中去除的字符
+_MIXIN_KEY_ENC_TAB = (
+    46, 47, 18, 2, 53, 8, 23, 32, 15, 50, 10, 31, 58, 3, 45, 35, 27, 43, 5, 49,
+    33, 9, 42, 19, 29, 28, 14, 39, 12, 38, 41, 13, 37, 48, 7, 16, 24, 55, 40,
+    61, 26, 17, 0, 1, 60, 51, 30, 4, 22, 25, 54, 21, 56, 59, 6, 63, 57, 62, 11,
+    36, 20, 34, 44, 52
+)
+_WBI_STRIP_TABLE = str.maketrans("", "", "!'()*")
+
+# B站输入解析用的预编译正则
+_B23_RE = re.compile(r"https?://b23\.tv/[^ \n]+")
+_BILI_P_RE = re.compile(r"[?&]p=(\d+)")
+# BV 号与 av 号合并为一个正则，一次扫描同时查找两者
+_BV_AV_RE = re.compile(r"(?P<bv>BV[0-9A-Za-z]{10})|av(?P<av>\d+)", re.I)
+_BILI_URL_RE = re.compile(r"https?://(?:www\.|m\.|)bilibili\.com/[^ \n]+|https?://b23\.tv/[^ \n]+")
+
+_URL_SCHEMES = ('http://', 'https://', 'ftp://', 'file://')
+
+# 以文件形式发送时可识别为视频的扩展名
+_VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm', '.m4v', '.mpeg', '.mpg', '.3gp')
+
+# _format_error 的常见问题提示表: [(匹配函数(错误信息, 小写错误信息, 异常), 提示)]，按顺序匹配
+_ERROR_HINTS = [
+    (lambda msg, lower, e: "timeout" in lower or isinstance(e, asyncio.TimeoutError),
+     "💡 提示: 请求超时，可能是视频过大或网络不稳定，请尝试增加超时时间或使用较小的视频。"),
+    (lambda msg, lower, e: "401" in msg or "403" in msg or ("invalid" in lower and "key" in lower),
+     "💡 提示: API Key 可能无效或已过期，请检查插件配置中的 Gemini API Key。"),
+    (lambda msg, lower, e: "429" in msg,
+     "💡 提示: API 请求频率过高，请稍后再试。"),
+    (lambda msg, lower, e: "500" in msg or "502" in msg or "503" in msg,
+     "💡 提示: Gemini 服务端错误，请稍后再试。"),
+    (lambda msg, lower, e: "connection" in lower or "network" in lower,
+     "💡 提示: 网络连接错误，请检查网络状态和 API 地址配置。"),
+]
+
+
+@lru_cache(maxsize=128)
+def _is_local_path(path: str) -> bool:
+    """检测给定的字符串是否为本地文件路径而非 URL"""
+    if not path:
+        return False
+
+    # URL 编码的路径需要先解码
+    decoded_path = urllib.parse.unquote(path)
+
+    # 检查是否为 Windows 绝对路径 (如 C:\..., D:\..., c%3A\...)
+    if len(decoded_path) >= 2:
+        # Windows 路径: C:\ 或 C:/
+        if decoded_path[1] == ':' and (len(decoded_path) == 2 or decoded_path[2] in ('\\', '/')):
+            return True
+
+    # 检查是否为 Unix 绝对路径 (如 /home/...)
+    if decoded_path.startswith('/') and not decoded_path.startswith('//'):
+        # 排除网络路径 //server/share
+        return True
+
+    # 检查是否包含典型的 URL scheme
+    if path.startswith(_URL_SCHEMES):
+        return False
+
+    # 检查是否看起来像本地路径（包含反斜杠或路径分隔符但不是 URL）
+    if ('\\' in decoded_path or '%5C' in path.upper() or '%5c' in path.lower()):
+        return True
+
+    return False
+
+
+def _acquire_buffer() -> bytearray:
+    """从缓冲区池中取出一个下载缓冲区，池为空时新建"""
+    return _buf_pool.pop() if _buf_pool else bytearray(_DOWNLOAD_CHUNK_SIZE)
+
+
+def _release_buffer(buf: bytearray):
+    """归还下载缓冲区，超出池容量时直接丢弃"""
+    if len(_buf_pool) < _BUF_POOL_MAX:
+        _buf_pool.append(buf)
+
+
+def _pick(d: dict, *keys: str):
+    """按顺序返回 d 中第一个值为真的键对应的值，都不存在时返回 None"""
+    return next((d[k] for k in keys if d.get(k)), None)
+
+
+def _make_dirs(*paths: str):
+    """创建所需的目录（已存在时忽略）"""
+    for path in paths:
+        os.makedirs(path, exist_ok=True)
+
+
+def _remove_if_exists(path: str) -> bool:
+    """删除文件，文件不存在时忽略；返回是否实际删除了文件"""
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _mmap_file(file_path: str) -> Tuple[object, mmap.mmap]:
+    """以只读方式打开并映射文件，返回 (文件对象, 映射)，由调用方负责关闭"""
+    f = open(file_path, 'rb')
+    try:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except BaseException:
+        f.close()
+        raise
+    if hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+    return f, mm
+
+
+def _b64_encode_mmap_block(mm: mmap.mmap, offset: int) -> bytes:
+    """复制映射中的一块数据并编码为 base64（在线程中调用）
+
+    切片复制不会导出映射的缓冲区，调用方被取消时可直接关闭映射，不会因线程仍持有视图而失败。
+    """
+    return _b64.b64encode(mm[offset:offset + _B64_ENCODE_BLOCK])
+
+
+def _extract_gemini_error(body: bytes, default_code: int) -> Tuple[int, str]:
+    """从 Gemini 错误响应的原始字节中提取 (错误代码, 错误信息)，无法解析时使用响应原文"""
+    try:
+        err = json_loads(body).get("error", {})
+        return err.get("code", default_code), err.get("message") or body.decode('utf-8', errors='replace')
+    except Exception:
+        return default_code, body[:500].decode('utf-8', errors='replace')
+
+
+def _write_and_flush(f, data: bytes):
+    """写入数据并立即刷新到操作系统，使其他文件句柄可以读取到"""
+    f.write(data)
+    f.flush()
+
+
+def _write_base64_file(file_path: str, data: str, start: int = 0) -> int:
+    """从 data[start:] 分块解码 base64 数据并写入文件（在线程中执行），返回写入的字节数
+
+    每次只解码一块，避免同时持有完整的解码结果；块内的空白字符会被去除，
+    不足 4 字符的尾部留到下一块，保证每次解码都按 base64 分组对齐。
+    """
+    written = 0
+    pending = ""
+    with open(file_path, 'wb') as f:
+        for i in range(start, len(data), _B64_DECODE_BLOCK):
+            block = pending + data[i:i + _B64_DECODE_BLOCK].translate(_B64_WHITESPACE)
+            usable = len(block) - len(block) % 4
+            pending = block[usable:]
+            if usable:
+                decoded = _b64.b64decode(block[:usable])
+                f.write(decoded)
+                written += len(decoded)
+        if pending:
+            # 长度不是 4 的倍数的数据，交给 b64decode 按原有规则报错
+            decoded = _b64.b64decode(pending)
+            f.write(decoded)
+            written += len(decoded)
+    return written
+
+
+def _uri_cache_key(api_base: str, api_key: str, file_sha: str) -> str:
+    """已上传文件缓存的键：文件 SHA-256 加上 API 地址与 Key 的摘要，不同账号/项目上传的文件互不复用"""
+    account = hashlib.sha256(f"{api_base}\n{api_key}".encode()).hexdigest()[:16]
+    return f"{account}:{file_sha}"
+
+
+def _upload_succeeded(upload_task: Optional[asyncio.Task]) -> bool:
+    """边下载边上传的任务是否已完成并成功提交文件（此时上传会话已结束，无需取消）"""
+    if upload_task is None or not upload_task.done() or upload_task.cancelled():
+        return False
+    if upload_task.exception() is not None:
+        return False
+    upload_response, _ = upload_task.result()
+    return upload_response is not None and upload_response[0] == 200
+
+
+def _sha256_file(file_path: str) -> str:
+    """计算文件的 SHA-256（按 1MB 分块读取）"""
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while True:
+            block = f.read(1024 * 1024)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+class _DownloadProgress:
+    """记录视频已写入磁盘的字节数，供边下载边上传的上传协程等待新数据"""
+
+    def __init__(self):
+        self.written = 0
+        self.done = False
+        self.failed = False
+        self._event = asyncio.Event()
+
+    def advance(self, n: int):
+        self.written += n
+        self._event.set()
+
+    def finish(self, failed: bool = False):
+        self.done = True
+        self.failed = failed
+        self._event.set()
+
+    async def wait(self):
+        await self._event.wait()
+        self._event.clear()
+
 
 class ViewVideoTool(FunctionTool):
     def __init__(self, plugin_instance):
@@ -56,33 +310,41 @@ class ViewVideoTool(FunctionTool):
         )
         self.plugin = plugin_instance
         self.config = self.plugin.config.get("gemini_video_config", {})
+        # B站视频元信息缓存: {(bvid, aid, p, qn): (expire_at, meta)}
+        self._bili_meta_cache: Dict[tuple, Tuple[float, Dict]] = {}
+        # b23.tv 短链解析结果缓存: {short_url: (expire_at, resolved_url)}
+        self._short_link_cache: Dict[str, Tuple[float, str]] = {}
+        # B站 WBI 签名用的 mixin key 缓存: (mixin_key, expire_at)
+        self._wbi_cache: Optional[Tuple[str, float]] = None
+        # 防止并发请求同时刷新 WBI 密钥
+        self._wbi_lock = asyncio.Lock()
+        # 已上传到 File API 的文件缓存: {_uri_cache_key(...): {"uri", "name", "exp"}}，首次使用时从磁盘加载
+        self._uri_cache: Optional[Dict[str, Dict]] = None
+
+    def prune_caches(self):
+        """清理过期的 B站视频元信息与短链解析缓存，由插件的缓存清理任务定期调用"""
+        now = time.monotonic()
+        for cache in (self._bili_meta_cache, self._short_link_cache):
+            expired = [k for k, (expire_at, _) in cache.items() if expire_at <= now]
+            for k in expired:
+                del cache[k]
     
     def _format_error(self, stage: str, error: Exception, details: str = "") -> str:
         """格式化错误信息，包含阶段、错误类型、错误消息和详细信息"""
-        error_type = type(error).__name__
         error_msg = str(error)
+        error_lower = error_msg.lower()
         
-        result = f"❌ 视频分析失败\n"
-        result += f"📍 失败阶段: {stage}\n"
-        result += f"🔴 错误类型: {error_type}\n"
-        result += f"💬 错误信息: {error_msg}\n"
-        
-        if details:
-            result += f"📝 详细信息: {details}\n"
-        
-        # 添加常见问题提示
-        if "timeout" in error_msg.lower() or isinstance(error, asyncio.TimeoutError):
-            result += f"💡 提示: 请求超时，可能是视频过大或网络不稳定，请尝试增加超时时间或使用较小的视频。"
-        elif "401" in error_msg or "403" in error_msg or "invalid" in error_msg.lower() and "key" in error_msg.lower():
-            result += f"💡 提示: API Key 可能无效或已过期，请检查插件配置中的 Gemini API Key。"
-        elif "429" in error_msg:
-            result += f"💡 提示: API 请求频率过高，请稍后再试。"
-        elif "500" in error_msg or "502" in error_msg or "503" in error_msg:
-            result += f"💡 提示: Gemini 服务端错误，请稍后再试。"
-        elif "connection" in error_msg.lower() or "network" in error_msg.lower():
-            result += f"💡 提示: 网络连接错误，请检查网络状态和 API 地址配置。"
+        # 添加常见问题提示（按 _ERROR_HINTS 顺序取第一个匹配项）
+        hint = next((h for match, h in _ERROR_HINTS if match(error_msg, error_lower, error)), "")
+        detail_line = f"📝 详细信息: {details}\n" if details else ""
         
-        return result
+        return (
+            f"❌ 视频分析失败\n"
+            f"📍 失败阶段: {stage}\n"
+            f"🔴 错误类型: {type(error).__name__}\n"
+            f"💬 错误信息: {error_msg}\n"
+            f"{detail_line}{hint}"
+        )
         
     async def call(self, context: ContextWrapper[AstrAgentContext], **kwargs) -> ToolExecResult:
         event = context.context.event
@@ -127,6 +389,10 @@ class ViewVideoTool(FunctionTool):
         prompt = self.config.get("prompt", "请描述视频内容")
         timeout = self.config.get("timeout", 120)
         upload_mode = self.config.get("upload_mode", "file_api")
+        transcode_enabled = self.config.get("transcode_enabled", False)
+        transcode_above_mb = self.config.get("transcode_above_mb", 64)
+        # 复用已上传文件时需先根据完整文件的 SHA-256 查询缓存，不进行边下载边上传
+        reuse_files = self.config.get("reuse_uploaded_files", False)
         bilibili_quality_conf = self.config.get("bilibili_quality", "fluent")
         
         # Determine Bilibili quality
@@ -137,6 +403,14 @@ class ViewVideoTool(FunctionTool):
         file_name = f"video_{int(time.time())}.mp4"
         bilibili_meta = {}
         download_headers = None
+        upload_init_task = None
+        upload_task = None
+        # B站视频的磁盘缓存路径；cached_file 为 True 表示直接使用了缓存文件
+        bili_cache_path = None
+        cached_file = False
+        downloaded_ok = False
+        # 转码后的视频路径（未转码时为 None）
+        transcoded_path = None
         
         try:
             if message_id:
@@ -165,27 +439,25 @@ class ViewVideoTool(FunctionTool):
                     msg_payload = msg_data.get("data", msg_data)
                     message_content = msg_payload.get('message', [])
                     
-                    # 查找视频组件
+                    # 查找视频组件：优先 video 类型，没有时再查找以文件形式发送的视频
                     video_comp = None
                     found_types = []
-                    video_extensions = ('.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm', '.m4v', '.mpeg', '.mpg', '.3gp')
                     
                     if isinstance(message_content, list):
-                        for comp in message_content:
-                            if isinstance(comp, dict):
-                                comp_type = comp.get('type', 'unknown')
-                                found_types.append(comp_type)
-                                if comp_type == 'video':
+                        comps = [comp for comp in message_content if isinstance(comp, dict)]
+                        found_types = [comp.get('type', 'unknown') for comp in comps]
+                        video_comp = next((comp for comp in comps if comp.get('type') == 'video'), None)
+                        if video_comp is None:
+                            for comp in comps:
+                                if comp.get('type') != 'file':
+                                    continue
+                                comp_data = comp.get('data') or {}
+                                f_name = _pick(comp_data, 'file', 'name') or _pick(comp, 'file', 'name') or ''
+                                if f_name.lower().endswith(_VIDEO_EXTENSIONS):
                                     video_comp = comp
+                                    video_comp['_is_file_video'] = True
+                                    logger.info(f"Detected video file sent as file type: {f_name}")
                                     break
-                                if comp_type == 'file':
-                                    comp_data = comp.get('data', {})
-                                    f_name = comp_data.get('file', '') or comp_data.get('name', '') or comp.get('file', '') or comp.get('name', '')
-                                    if f_name and f_name.lower().endswith(video_extensions):
-                                        video_comp = comp
-                                        video_comp['_is_file_video'] = True
-                                        logger.info(f"Detected video file sent as file type: {f_name}")
-                                        break
                     
                     if not video_comp:
                         return f"❌ 该消息中未包含视频文件\n📝 消息内容类型: {found_types}"
@@ -193,11 +465,10 @@ class ViewVideoTool(FunctionTool):
                     # 获取视频下载链接
                     video_data_field = video_comp.get("data") or {}
                     is_file_video = video_comp.get('_is_file_video', False)
-                    video_url = video_data_field.get('url') or video_comp.get('url')
-                    file_id = video_data_field.get('file_id') or video_data_field.get('file') or video_comp.get('file_id') or video_comp.get('file')
-                    
-                    if is_file_video:
-                        file_id = video_data_field.get('file_id') or video_data_field.get('file') or video_data_field.get('id') or video_comp.get('file_id') or video_comp.get('file')
+                    video_url = _pick(video_data_field, 'url') or _pick(video_comp, 'url')
+                    # 以文件形式发送的视频还可能只提供 data.id
+                    data_id_keys = ('file_id', 'file', 'id') if is_file_video else ('file_id', 'file')
+                    file_id = _pick(video_data_field, *data_id_keys) or _pick(video_comp, 'file_id', 'file')
 
                     if not video_url and file_id:
                         try:
@@ -222,7 +493,7 @@ class ViewVideoTool(FunctionTool):
 
                 except Exception as e:
                     if "❌" in str(e): return str(e)
-                    logger.error(f"Error getting video info: {e}\n{traceback.format_exc()}")
+                    logger.error(f"Error getting video info: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
                     return self._format_error("获取视频信息", e, f"message_id={message_id}")
             
             elif bilibili_input:
@@ -231,16 +502,22 @@ class ViewVideoTool(FunctionTool):
                     # Resolve short link
                     real_input = bilibili_input
                     if "b23.tv" in bilibili_input:
-                        url_match = re.search(r"(https?://b23\.tv/[^ \n]+)", bilibili_input)
+                        url_match = _B23_RE.search(bilibili_input)
                         if url_match:
-                            real_input = await self._resolve_short_link(url_match.group(1))
+                            real_input = await self._resolve_short_link(url_match.group(0))
 
                     bvid, aid, p = self._parse_bilibili_input(real_input)
                     if not bvid and not aid:
                         return f"❌ 无法识别的B站链接/ID\n📝 输入: {bilibili_input[:50]}...\n💡 支持: BV号、av号、视频链接、b23.tv短链"
 
-                    # Get metadata and play url
-                    bilibili_meta = await self._get_bilibili_video_data(bvid, aid, p, qn)
+                    # Get metadata and play url (短时间内重复查询同一视频时使用缓存)
+                    meta_key = (bvid, aid, p, qn)
+                    cached_meta = self._bili_meta_cache.get(meta_key)
+                    if cached_meta and cached_meta[0] > time.monotonic():
+                        bilibili_meta = cached_meta[1]
+                    else:
+                        bilibili_meta = await self._get_bilibili_video_data(bvid, aid, p, qn)
+                        self._bili_meta_cache[meta_key] = (time.monotonic() + _BILI_META_CACHE_TTL, bilibili_meta)
                     
                     # Duration Check
                     if bilibili_meta['duration'] > duration_limit:
@@ -248,6 +525,10 @@ class ViewVideoTool(FunctionTool):
 
                     video_url = bilibili_meta['url']
                     file_name = f"video_bilibili_{bilibili_meta.get('bvid', 'unknown')}_p{p}.mp4"
+                    if self.config.get("bili_cache_mb", 0) > 0:
+                        bili_cache_path = os.path.join(
+                            self._get_bili_cache_dir(), f"bili_{bilibili_meta['cid']}_qn{qn}.mp4"
+                        )
                     download_headers = {
                         'Referer': 'https://www.bilibili.com/',
                         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
@@ -258,7 +539,7 @@ class ViewVideoTool(FunctionTool):
                     prompt = f"{bili_info_text}\n{prompt}\n(请结合视频画面和上述B站元信息进行分析，元信息仅供参考)"
 
                 except Exception as e:
-                    logger.error(f"Error getting bilibili info: {e}\n{traceback.format_exc()}")
+                    logger.error(f"Error getting bilibili info: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
                     return self._format_error("获取B站信息", e)
 
             elif element_id is not None:
@@ -285,7 +566,7 @@ class ViewVideoTool(FunctionTool):
                 except ImportError:
                     return "❌ 浏览器模块未启用。请确保已启用浏览器工具。"
                 except Exception as e:
-                    logger.error(f"Error getting video from browser element: {e}\n{traceback.format_exc()}")
+                    logger.error(f"Error getting video from browser element: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
                     return self._format_error("获取浏览器视频元素", e)
 
             elif video_url_input:
@@ -303,93 +584,179 @@ class ViewVideoTool(FunctionTool):
             temp_dir = os.path.join(get_astrbot_data_path(), "qq_tools", "temp")
             local_file_path = os.path.join(temp_dir, file_name)
             try:
-                os.makedirs(temp_dir, exist_ok=True)
+                # 文件系统操作放在线程中执行，避免网络存储卡顿时阻塞事件循环
+                dirs = [temp_dir]
+                if bili_cache_path:
+                    dirs.append(os.path.dirname(bili_cache_path))
+                await asyncio.to_thread(_make_dirs, *dirs)
             except Exception as e:
                 return self._format_error("创建临时目录", e, f"路径: {temp_dir}")
             
+            # 命中 B站视频磁盘缓存时直接使用缓存文件，跳过下载
+            if bili_cache_path and await asyncio.to_thread(self._is_bili_cache_fresh, bili_cache_path):
+                local_file_path = bili_cache_path
+                cached_file = True
+                logger.info(f"Using cached bilibili video: {bili_cache_path}")
+            
             # ... (Download Logic) ...
+            # 各分支在获取视频时已检查大小限制，这里记录得到的文件大小用于日志
+            actual_size = None
             try:
+                if cached_file:
+                    # 缓存的视频可能是在调低大小限制之前下载的，同样需要检查
+                    actual_size = await asyncio.to_thread(os.path.getsize, local_file_path)
+                    cached_size_mb = actual_size / 1024 / 1024
+                    if cached_size_mb > size_limit_mb:
+                        return f"❌ 视频文件过大\n📝 文件大小: {cached_size_mb:.2f}MB\n📝 限制大小: {size_limit_mb}MB"
                 # 检查是否为 base64 格式
-                if video_url.startswith("base64://"):
+                elif video_url.startswith("base64://"):
+                    # 按编码长度估算解码后的大小，超出限制时无需解码
+                    estimated_size_mb = (len(video_url) - 9) * 3 / 4 / 1024 / 1024
+                    if estimated_size_mb > size_limit_mb:
+                        return f"❌ 视频文件过大\n📝 文件大小: {estimated_size_mb:.2f}MB\n📝 限制大小: {size_limit_mb}MB"
                     try:
-                        base64_data = video_url[9:]
-                        video_bytes = base64.b64decode(base64_data)
-                        with open(local_file_path, 'wb') as f:
-                            f.write(video_bytes)
+                        # 大体积数据的解码与写入在线程中进行，避免阻塞事件循环
+                        actual_size = await asyncio.to_thread(_write_base64_file, local_file_path, video_url, 9)
                         logger.info(f"Video saved from base64: {local_file_path}")
                     except Exception as e:
                         return self._format_error("解码 Base64 视频", e)
-                elif self._is_local_path(video_url):
+                elif _is_local_path(video_url):
                     # 本地文件路径
                     try:
                         decoded_path = urllib.parse.unquote(video_url)
                         logger.info(f"Detected local file path: {decoded_path}")
                         
-                        if not os.path.exists(decoded_path):
+                        try:
+                            source_size = await asyncio.to_thread(os.path.getsize, decoded_path)
+                        except FileNotFoundError:
                             return f"❌ 本地视频文件不存在\n📝 路径: {decoded_path}"
                         
-                        source_size = os.path.getsize(decoded_path)
                         source_size_mb = source_size / 1024 / 1024
                         if source_size_mb > size_limit_mb:
                             return f"❌ 视频文件过大\n📝 文件大小: {source_size_mb:.2f}MB\n📝 限制大小: {size_limit_mb}MB"
                         
-                        shutil.copy2(decoded_path, local_file_path)
+                        await asyncio.to_thread(shutil.copy2, decoded_path, local_file_path)
+                        actual_size = source_size
                         logger.info(f"Video copied from local path: {decoded_path} -> {local_file_path}")
                     except Exception as e:
                         return self._format_error("复制本地视频文件", e, f"源路径: {video_url}")
                 else:
                     # 正常 HTTP 下载 (Added headers support for Bilibili)
-                    async with aiohttp.ClientSession() as session:
-                        try:
-                            req_headers = download_headers or {}
-                            async with session.get(video_url, headers=req_headers, timeout=aiohttp.ClientTimeout(total=120)) as resp:
-                                if resp.status != 200:
-                                    return f"❌ 下载视频失败\n📝 HTTP状态码: {resp.status}\n💬 URL: {video_url[:100]}..."
+                    session = self.plugin.get_http_session()
+                    try:
+                        req_headers = download_headers or {}
+                        async with session.get(video_url, headers=req_headers, timeout=aiohttp.ClientTimeout(total=120)) as resp:
+                            if resp.status != 200:
+                                return f"❌ 下载视频失败\n📝 HTTP状态码: {resp.status}\n💬 URL: {video_url[:100]}..."
                                 
-                                content_length = resp.headers.get('Content-Length')
-                                if content_length:
-                                    size_mb = int(content_length) / 1024 / 1024
-                                    if size_mb > size_limit_mb:
-                                        return f"❌ 视频文件过大\n📝 文件大小: {size_mb:.2f}MB\n📝 限制大小: {size_limit_mb}MB"
+                            content_length = resp.headers.get('Content-Length')
+                            if content_length:
+                                size_mb = int(content_length) / 1024 / 1024
+                                if size_mb > size_limit_mb:
+                                    return f"❌ 视频文件过大\n📝 文件大小: {size_mb:.2f}MB\n📝 限制大小: {size_limit_mb}MB"
                                 
-                                with open(local_file_path, 'wb') as f:
+                            # 文件写入在线程中进行，避免阻塞事件循环
+                            f = await asyncio.to_thread(open, local_file_path, 'wb')
+                            try:
+                                # File API 模式下边下载边上传，上传从已写入磁盘的数据中读取
+                                progress = None
+                                # 启用转码且视频可能超过转码阈值时，上传的是转码后的文件，不进行边下载边上传
+                                may_transcode = transcode_enabled and (
+                                    not content_length or int(content_length) / 1024 / 1024 > transcode_above_mb
+                                )
+                                # 此时确定会上传，上传初始化请求与视频下载并发进行，隐藏一次请求往返的延迟
+                                if upload_mode == "file_api" and not may_transcode and not reuse_files:
+                                    upload_init_task = asyncio.create_task(self._init_resumable_upload(
+                                        api_url, api_key, self._get_mime_type(file_name), file_name
+                                    ))
+                                    progress = _DownloadProgress()
+                                    upload_task = asyncio.create_task(self._pipeline_upload(
+                                        upload_init_task, local_file_path, timeout, progress
+                                    ))
+
+                                async def write_out(data):
+                                    if progress:
+                                        await asyncio.to_thread(_write_and_flush, f, data)
+                                        progress.advance(len(data))
+                                    else:
+                                        await asyncio.to_thread(f.write, data)
+
+                                # 网络返回的小数据块先拷入缓冲区，攒满后一次写盘，减少线程切换次数
+                                buf = _acquire_buffer()
+                                try:
+                                    size_limit_bytes = size_limit_mb * 1024 * 1024
                                     downloaded = 0
-                                    while True:
-                                        chunk = await resp.content.read(8192)
-                                        if not chunk:
-                                            break
-                                        f.write(chunk)
-                                        downloaded += len(chunk)
-                                        if downloaded > size_limit_mb * 1024 * 1024:
+                                    filled = 0
+                                    async for chunk in resp.content.iter_chunked(_DOWNLOAD_CHUNK_SIZE):
+                                        n = len(chunk)
+                                        downloaded += n
+                                        if downloaded > size_limit_bytes:
                                             raise Exception(f"下载过程中超出大小限制 ({size_limit_mb}MB)")
-                        except asyncio.TimeoutError:
-                            return f"❌ 下载视频超时\n📝 超时时间: 120秒"
-
-                actual_size = os.path.getsize(local_file_path)
-                actual_size_mb = actual_size / 1024 / 1024
-                if actual_size_mb > size_limit_mb:
-                    os.remove(local_file_path)
-                    return f"❌ 视频文件过大\n📝 实际大小: {actual_size_mb:.2f}MB\n📝 限制大小: {size_limit_mb}MB"
-                
-                logger.info(f"Video downloaded successfully: {local_file_path} ({actual_size_mb:.2f}MB)")
+                                        if filled + n > len(buf):
+                                            await write_out(memoryview(buf)[:filled])
+                                            filled = 0
+                                        buf[filled:filled + n] = chunk
+                                        filled += n
+                                    if filled:
+                                        await write_out(memoryview(buf)[:filled])
+                                    actual_size = downloaded
+                                except BaseException:
+                                    # 被取消时写盘线程可能仍在使用缓冲区，因此不归还
+                                    if progress:
+                                        progress.finish(failed=True)
+                                    raise
+                                _release_buffer(buf)
+                                if progress:
+                                    progress.finish()
+                            finally:
+                                await asyncio.to_thread(f.close)
+                    except asyncio.TimeoutError:
+                        return f"❌ 下载视频超时\n📝 超时时间: 120秒"
+
+                if actual_size is not None and not cached_file:
+                    logger.info(f"Video downloaded successfully: {local_file_path} ({actual_size / 1024 / 1024:.2f}MB)")
+                downloaded_ok = True
                 
             except Exception as e:
-                if os.path.exists(local_file_path):
-                    try: os.remove(local_file_path)
-                    except: pass
+                try: await asyncio.to_thread(_remove_if_exists, local_file_path)
+                except: pass
                 if "❌" in str(e): return str(e)
-                logger.error(f"Error downloading video: {e}\n{traceback.format_exc()}")
+                logger.error(f"Error downloading video: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
                 return self._format_error("下载视频", e, f"URL: {video_url[:100]}...")
 
+            # 视频超过阈值时先转码为低分辨率、低码率版本，减少上传的数据量
+            upload_file_path = local_file_path
+            if transcode_enabled and upload_task is None:
+                if actual_size is None:
+                    actual_size = await asyncio.to_thread(os.path.getsize, local_file_path)
+                source_size_mb = actual_size / 1024 / 1024
+                if source_size_mb > transcode_above_mb:
+                    try:
+                        transcoded_path = await self._transcode_video(local_file_path, temp_dir)
+                    except Exception as e:
+                        logger.warning(f"视频转码出错，使用原视频上传: {e}")
+                    if transcoded_path:
+                        upload_file_path = transcoded_path
+
             # 3. 根据配置选择上传方式
             try:
-                if upload_mode == "file_api":
+                use_file_api = upload_mode == "file_api"
+                if not use_file_api:
+                    # 超出 inlineData 请求大小限制的视频自动改用 File API 上传
+                    inline_size = actual_size if upload_file_path == local_file_path and actual_size is not None \
+                        else await asyncio.to_thread(os.path.getsize, upload_file_path)
+                    if (inline_size + 2) // 3 * 4 > _INLINE_MAX_BYTES:
+                        logger.info(f"Video too large for inline upload ({inline_size / 1024 / 1024:.2f}MB), using File API")
+                        use_file_api = True
+                
+                if use_file_api:
                     result_text, error_info = await self._process_with_file_api(
-                        api_url, api_key, model_id, local_file_path, prompt, timeout
+                        api_url, api_key, model_id, upload_file_path, prompt, timeout,
+                        upload_task=upload_task
                     )
                 else:
                     result_text, error_info = await self._process_with_inline_base64(
-                        api_url, api_key, model_id, local_file_path, prompt, timeout
+                        api_url, api_key, model_id, upload_file_path, prompt, timeout
                     )
                 
                 if error_info:
@@ -403,45 +770,123 @@ class ViewVideoTool(FunctionTool):
                 return final_result
                 
             except Exception as e:
-                logger.error(f"Error processing with Gemini: {e}\n{traceback.format_exc()}")
+                logger.error(f"Error processing with Gemini: {e}", exc_info=logger.isEnabledFor(logging.DEBUG))
                 return self._format_error("Gemini API 调用", e, f"模型: {model_id}, API地址: {api_url}, 上传方式: {upload_mode}")
         finally:
-            # 清理临时文件
-            if local_file_path and os.path.exists(local_file_path):
+            # 下载失败等提前返回时，取消尚未完成的上传任务
+            if upload_task and not upload_task.done():
+                upload_task.cancel()
+            # 已建立但未完成上传的会话显式取消，避免遗留在服务端
+            if upload_init_task and not _upload_succeeded(upload_task):
+                self.plugin.create_background_task(self._discard_upload_session(upload_init_task))
+            
+            # B站视频下载成功后移入磁盘缓存，供之后重复查询使用
+            if bili_cache_path and downloaded_ok and not cached_file:
+                try:
+                    await asyncio.to_thread(os.replace, local_file_path, bili_cache_path)
+                    logger.debug(f"Cached bilibili video: {bili_cache_path}")
+                    await asyncio.to_thread(
+                        self._evict_bili_cache, self.config.get("bili_cache_mb", 0) * 1024 * 1024
+                    )
+                except Exception as e:
+                    logger.warning(f"Failed to cache bilibili video: {e}")
+            
+            # 清理转码生成的文件
+            if transcoded_path:
+                try:
+                    await asyncio.to_thread(_remove_if_exists, transcoded_path)
+                except Exception as e:
+                    logger.warning(f"Failed to clean up transcoded file: {e}")
+            
+            # 清理临时文件（缓存文件不删除）
+            if local_file_path and not cached_file:
                 try:
-                    os.remove(local_file_path)
-                    logger.debug(f"Cleaned up temp file: {local_file_path}")
+                    if await asyncio.to_thread(_remove_if_exists, local_file_path):
+                        logger.debug(f"Cleaned up temp file: {local_file_path}")
                 except Exception as e:
                     logger.warning(f"Failed to clean up temp file: {e}")
 
-    def _is_local_path(self, path: str) -> bool:
-        """检测给定的字符串是否为本地文件路径而非 URL"""
-        if not path:
+    def _get_bili_cache_dir(self) -> str:
+        """获取 B站视频磁盘缓存目录"""
+        return os.path.join(get_astrbot_data_path(), "qq_tools", "bili_cache")
+
+    def _is_bili_cache_fresh(self, cache_path: str) -> bool:
+        """检查 B站视频缓存文件是否存在且未过期，命中时刷新其修改时间用于 LRU 淘汰"""
+        try:
+            if time.time() - os.path.getmtime(cache_path) > _BILI_FILE_CACHE_TTL:
+                return False
+            os.utime(cache_path)
+            return True
+        except OSError:
             return False
+
+    def _evict_bili_cache(self, limit_bytes: int):
+        """B站视频磁盘缓存超出容量时，按修改时间从旧到新淘汰（LRU），并删除过期文件"""
+        cache_dir = self._get_bili_cache_dir()
+        entries = []
+        for entry in os.scandir(cache_dir):
+            if entry.is_file():
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
         
-        # URL 编码的路径需要先解码
-        decoded_path = urllib.parse.unquote(path)
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        now = time.time()
+        for mtime, size, path in entries:
+            if total <= limit_bytes and now - mtime <= _BILI_FILE_CACHE_TTL:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+                logger.debug(f"Evicted cached bilibili video: {path}")
+            except OSError as e:
+                logger.debug(f"Failed to evict cached video {path}: {e}")
+
+    async def _transcode_video(self, file_path: str, output_dir: str) -> Optional[str]:
+        """使用 ffmpeg 将视频转码为 720p、约 1Mbps 的 H.264 视频
+
+        Returns:
+            转码后的文件路径；未安装 ffmpeg、转码失败或转码后没有变小时返回 None
+        """
+        base_name = os.path.splitext(os.path.basename(file_path))[0]
+        out_path = os.path.join(output_dir, f"{base_name}_transcoded.mp4")
         
-        # 检查是否为 Windows 绝对路径 (如 C:\..., D:\..., c%3A\...)
-        if len(decoded_path) >= 2:
-            # Windows 路径: C:\ 或 C:/
-            if decoded_path[1] == ':' and (len(decoded_path) == 2 or decoded_path[2] in ('\\', '/')):
-                return True
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                "ffmpeg", "-nostdin", "-loglevel", "error", "-i", file_path,
+                "-vf", "scale=-2:'min(720,ih)'", "-c:v", "libx264", "-preset", "veryfast", "-b:v", "1M",
+                "-c:a", "aac", "-b:a", "96k", "-movflags", "+faststart", "-y", out_path,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE
+            )
+        except FileNotFoundError:
+            logger.warning("未找到 ffmpeg，跳过视频转码")
+            return None
         
-        # 检查是否为 Unix 绝对路径 (如 /home/...)
-        if decoded_path.startswith('/') and not decoded_path.startswith('//'):
-            # 排除网络路径 //server/share
-            return True
+        try:
+            _, stderr = await proc.communicate()
+        except asyncio.CancelledError:
+            proc.kill()
+            await proc.wait()
+            await asyncio.to_thread(_remove_if_exists, out_path)
+            raise
         
-        # 检查是否包含典型的 URL scheme
-        if path.startswith(('http://', 'https://', 'ftp://', 'file://')):
-            return False
+        # 文件系统操作放在线程中执行，避免阻塞事件循环
+        if proc.returncode != 0 or not await asyncio.to_thread(os.path.exists, out_path):
+            err_text = stderr.decode('utf-8', errors='replace')[-500:] if stderr else ''
+            logger.warning(f"视频转码失败 (code={proc.returncode})，使用原视频上传: {err_text}")
+            await asyncio.to_thread(_remove_if_exists, out_path)
+            return None
         
-        # 检查是否看起来像本地路径（包含反斜杠或路径分隔符但不是 URL）
-        if ('\\' in decoded_path or '%5C' in path.upper() or '%5c' in path.lower()):
-            return True
+        source_size = await asyncio.to_thread(os.path.getsize, file_path)
+        out_size = await asyncio.to_thread(os.path.getsize, out_path)
+        if out_size >= source_size:
+            logger.info("转码后的视频没有变小，使用原视频上传")
+            await asyncio.to_thread(_remove_if_exists, out_path)
+            return None
         
-        return False
+        logger.info(f"Video transcoded: {source_size / 1024 / 1024:.2f}MB -> {out_size / 1024 / 1024:.2f}MB")
+        return out_path
 
     def _get_mime_type(self, file_path: str) -> str:
         """根据文件扩展名获取 MIME 类型"""
@@ -461,16 +906,18 @@ class ViewVideoTool(FunctionTool):
         }
         return mime_map.get(ext, 'video/mp4')
 
-    def _parse_generate_response(self, resp_text: str, model_id: str) -> Tuple[Optional[str], Optional[str]]:
-        """解析 Gemini generateContent 响应
+    def _parse_generate_response(self, resp_body: str | bytes, model_id: str) -> Tuple[Optional[str], Optional[str]]:
+        """解析 Gemini generateContent 响应（可直接传入响应的原始字节）
         
         Returns:
             tuple: (result_text, error_info) - 成功时 error_info 为 None，失败时 result_text 为 None
         """
         try:
-            result = json.loads(resp_text)
-        except json.JSONDecodeError as e:
-            return None, f"❌ 解析 Gemini 响应失败\n🔴 错误类型: JSON解析错误\n💬 错误信息: {e}\n📝 响应内容: {resp_text[:200]}..."
+            result = json_loads(resp_body)
+        except ValueError as e:
+            if isinstance(resp_body, bytes):
+                resp_body = resp_body[:200].decode('utf-8', errors='replace')
+            return None, f"❌ 解析 Gemini 响应失败\n🔴 错误类型: JSON解析错误\n💬 错误信息: {e}\n📝 响应内容: {resp_body[:200]}..."
         
         try:
             # 检查是否有安全过滤
@@ -483,7 +930,7 @@ class ViewVideoTool(FunctionTool):
             
             # 检查是否有候选结果
             if "candidates" not in result or len(result["candidates"]) == 0:
-                return None, f"❌ Gemini 未返回任何结果\n📝 响应内容: {json.dumps(result, ensure_ascii=False)[:300]}...\n💡 提示: 可能是视频无法被模型处理。"
+                return None, f"❌ Gemini 未返回任何结果\n📝 响应内容: {json_dumps(result)[:300]}...\n💡 提示: 可能是视频无法被模型处理。"
             
             candidate = result["candidates"][0]
             
@@ -503,24 +950,85 @@ class ViewVideoTool(FunctionTool):
             parts = content.get("parts", [])
             
             if not parts:
-                return None, f"❌ Gemini 返回空内容\n📝 候选结果: {json.dumps(candidate, ensure_ascii=False)[:300]}...\n💡 提示: 模型可能无法处理此视频。"
+                return None, f"❌ Gemini 返回空内容\n📝 候选结果: {json_dumps(candidate)[:300]}...\n💡 提示: 模型可能无法处理此视频。"
             
             text_content = parts[0].get("text", "")
             if not text_content:
-                return None, f"❌ Gemini 返回空文本\n📝 响应部分: {json.dumps(parts, ensure_ascii=False)[:300]}...\n💡 提示: 模型可能无法描述此视频内容。"
+                return None, f"❌ Gemini 返回空文本\n📝 响应部分: {json_dumps(parts)[:300]}...\n💡 提示: 模型可能无法描述此视频内容。"
             
             return text_content, None
             
         except (KeyError, IndexError) as e:
-            return None, f"❌ 解析 Gemini 结果失败\n🔴 错误类型: {type(e).__name__}\n💬 错误信息: {e}\n📝 响应内容: {json.dumps(result, ensure_ascii=False)[:300]}..."
+            return None, f"❌ 解析 Gemini 结果失败\n🔴 错误类型: {type(e).__name__}\n💬 错误信息: {e}\n📝 响应内容: {json_dumps(result)[:300]}..."
+
+    async def _init_resumable_upload(self, api_base: str, api_key: str, mime_type: str,
+                                     display_name: str, file_size: Optional[int] = None) -> Tuple[Optional[str], Optional[str]]:
+        """发起 File API resumable 上传请求，获取 upload_url
+        
+        file_size 未知时（如视频尚在下载中）不声明文件总大小，由最后一个 finalize 块确定。
+        
+        Returns:
+            tuple: (upload_url, error_info) - 成功时 error_info 为 None，失败时 upload_url 为 None
+        """
+        init_url = f"{api_base}/upload/v1beta/files?key={api_key}"
+        
+        init_headers = {
+            'X-Goog-Upload-Protocol': 'resumable',
+            'X-Goog-Upload-Command': 'start',
+            'X-Goog-Upload-Header-Content-Type': mime_type,
+            'Content-Type': 'application/json',
+        }
+        if file_size is not None:
+            init_headers['X-Goog-Upload-Header-Content-Length'] = str(file_size)
+        
+        init_body = json_dumps({
+            'file': {
+                'display_name': display_name
+            }
+        })
+        
+        logger.info(f"Step 1: Initiating resumable upload...")
+        
+        try:
+            session = self.plugin.get_http_session()
+            async with session.post(
+                init_url,
+                headers=init_headers,
+                data=init_body,
+                timeout=aiohttp.ClientTimeout(total=60)
+            ) as resp:
+                if resp.status != 200:
+                    resp_text = await resp.text()
+                    error_msg = f"❌ 初始化上传失败\n📝 HTTP状态码: {resp.status}\n💬 响应: {resp_text[:500]}\n"
+                    if resp.status == 400:
+                        error_msg += "💡 提示: 请求格式错误，可能是视频格式不支持。"
+                    elif resp.status == 401:
+                        error_msg += "💡 提示: API Key 无效，请检查配置。"
+                    return None, error_msg
+                    
+                # 从响应 header 获取 upload_url
+                upload_url = resp.headers.get('X-Goog-Upload-URL') or resp.headers.get('x-goog-upload-url')
+                    
+                if not upload_url:
+                    resp_text = await resp.text()
+                    return None, f"❌ 未获取到上传URL\n📝 响应头: {dict(resp.headers)}\n📝 响应体: {resp_text[:300]}..."
+                    
+                logger.info(f"Got upload URL: {upload_url[:100]}...")
+                return upload_url, None
+                    
+        except asyncio.TimeoutError:
+            return None, f"❌ 初始化上传超时\n📝 超时时间: 60秒\n💡 提示: 请检查网络连接。"
+        except aiohttp.ClientError as e:
+            return None, f"❌ 网络请求错误\n🔴 错误类型: {type(e).__name__}\n💬 错误信息: {e}\n💡 提示: 请检查网络连接和 API 地址配置。"
 
     async def _process_with_file_api(self, api_base: str, api_key: str, model_id: str,
-                                     file_path: str, prompt: str, timeout: int) -> Tuple[Optional[str], Optional[str]]:
+                                     file_path: str, prompt: str, timeout: int,
+                                     upload_task: Optional[asyncio.Task] = None) -> Tuple[Optional[str], Optional[str]]:
         """使用 Gemini File API 上传视频并生成内容（Resumable Upload 协议）
         
         File API 流程（两步上传协议）:
         1. 发起上传请求，获取 upload_url
-        2. 向 upload_url 上传实际文件数据
+        2. 向 upload_url 上传实际文件数据（upload_task 为边下载边上传的任务时直接等待其结果）
         3. 等待文件处理完成
         4. 调用生成接口
         5. 删除上传的文件（可选）
@@ -528,7 +1036,7 @@ class ViewVideoTool(FunctionTool):
         Returns:
             tuple: (result_text, error_info) - 成功时 error_info 为 None，失败时 result_text 为 None
         """
-        file_size = os.path.getsize(file_path)
+        file_size = await asyncio.to_thread(os.path.getsize, file_path)
         file_size_mb = file_size / 1024 / 1024
         mime_type = self._get_mime_type(file_path)
         display_name = os.path.basename(file_path)
@@ -537,288 +1045,478 @@ class ViewVideoTool(FunctionTool):
         
         uploaded_file_uri = None
         uploaded_file_name = None
+        # 启用文件复用时，上传的文件不再在调用结束后删除，而是在有效期内供相同内容的视频复用
+        reuse_files = self.config.get("reuse_uploaded_files", False)
+        keep_uploaded_file = False
+        file_sha = None
         
         try:
-            async with aiohttp.ClientSession() as session:
-                # Step 1: 发起上传请求，获取 upload_url
-                init_url = f"{api_base}/upload/v1beta/files?key={api_key}"
-                
-                init_headers = {
-                    'X-Goog-Upload-Protocol': 'resumable',
-                    'X-Goog-Upload-Command': 'start',
-                    'X-Goog-Upload-Header-Content-Length': str(file_size),
-                    'X-Goog-Upload-Header-Content-Type': mime_type,
-                    'Content-Type': 'application/json',
-                }
-                
-                init_body = json.dumps({
-                    'file': {
-                        'display_name': display_name
-                    }
-                })
-                
-                logger.info(f"Step 1: Initiating resumable upload...")
+            session = self.plugin.get_http_session()
+            # 相同内容的视频已上传过且未过期时，跳过上传直接调用生成接口
+            # （边下载边上传时上传已在进行，无法跳过）
+            if reuse_files and upload_task is None:
+                file_sha = await asyncio.to_thread(_sha256_file, file_path)
+                cached_uri = await self._get_cached_file_uri(_uri_cache_key(api_base, api_key, file_sha))
+                if cached_uri:
+                    logger.info(f"Reusing uploaded file for sha256={file_sha[:16]}...: {cached_uri}")
+                    result_text, error_info, status = await self._generate_with_file_uri(
+                        session, api_base, api_key, model_id, mime_type, cached_uri, prompt, timeout
+                    )
+                    if status not in (403, 404):
+                        return result_text, error_info
+                    # 文件已被删除或过期，重新上传
+                    logger.info(f"Cached file is no longer available (HTTP {status}), re-uploading...")
+                    await self._drop_cached_file(_uri_cache_key(api_base, api_key, file_sha))
                 
+            if upload_task is not None:
+                # Step 1-2 已在下载视频时边下载边完成
+                logger.info("Step 1-2: Waiting for pipelined upload to finish...")
                 try:
-                    async with session.post(
-                        init_url,
-                        headers=init_headers,
-                        data=init_body,
-                        timeout=aiohttp.ClientTimeout(total=60)
-                    ) as resp:
-                        if resp.status != 200:
-                            resp_text = await resp.text()
-                            error_msg = f"❌ 初始化上传失败\n📝 HTTP状态码: {resp.status}\n💬 响应: {resp_text[:500]}\n"
-                            if resp.status == 400:
-                                error_msg += "💡 提示: 请求格式错误，可能是视频格式不支持。"
-                            elif resp.status == 401:
-                                error_msg += "💡 提示: API Key 无效，请检查配置。"
-                            return None, error_msg
-                        
-                        # 从响应 header 获取 upload_url
-                        upload_url = resp.headers.get('X-Goog-Upload-URL') or resp.headers.get('x-goog-upload-url')
-                        
-                        if not upload_url:
-                            resp_text = await resp.text()
-                            return None, f"❌ 未获取到上传URL\n📝 响应头: {dict(resp.headers)}\n📝 响应体: {resp_text[:300]}..."
-                        
-                        logger.info(f"Got upload URL: {upload_url[:100]}...")
-                        
+                    upload_response, error_msg = await upload_task
                 except asyncio.TimeoutError:
-                    return None, f"❌ 初始化上传超时\n📝 超时时间: 60秒\n💡 提示: 请检查网络连接。"
-                
-                # Step 2: 向 upload_url 上传实际文件数据
+                    return None, f"❌ 文件上传超时\n📝 超时时间: {timeout}秒\n📝 文件大小: {file_size_mb:.2f}MB\n💡 提示: 请尝试增加超时时间或使用较小的视频。"
+                if error_msg:
+                    return None, error_msg
+            else:
+                # Step 1: 发起上传请求，获取 upload_url（在确认无可复用的已上传文件之后）
+                upload_url, error_msg = await self._init_resumable_upload(
+                    api_base, api_key, mime_type, display_name, file_size
+                )
+                if error_msg:
+                    return None, error_msg
+                    
+                # Step 2: 向 upload_url 分块上传实际文件数据
                 logger.info(f"Step 2: Uploading file data ({file_size_mb:.2f}MB)...")
-                
-                # 读取文件内容
-                with open(file_path, 'rb') as f:
-                    file_data = f.read()
-                
-                upload_headers = {
-                    'Content-Length': str(file_size),
-                    'X-Goog-Upload-Offset': '0',
-                    'X-Goog-Upload-Command': 'upload, finalize',
-                }
-                
                 try:
-                    async with session.post(
-                        upload_url,
-                        headers=upload_headers,
-                        data=file_data,
-                        timeout=aiohttp.ClientTimeout(total=timeout)
-                    ) as resp:
-                        resp_text = await resp.text()
-                        
-                        if resp.status != 200:
-                            error_msg = f"❌ 文件上传失败\n📝 HTTP状态码: {resp.status}\n💬 响应: {resp_text[:500]}\n"
-                            if resp.status == 400:
-                                error_msg += "💡 提示: 请求格式错误，可能是视频格式不支持。"
-                            elif resp.status == 413:
-                                error_msg += "💡 提示: 文件过大，请尝试使用较小的视频。"
-                            elif resp.status == 401:
-                                error_msg += "💡 提示: API Key 无效，请检查配置。"
-                            return None, error_msg
-                        
-                        try:
-                            upload_result = json.loads(resp_text)
-                            uploaded_file_name = upload_result.get("file", {}).get("name", "")
-                            uploaded_file_uri = upload_result.get("file", {}).get("uri", "")
-                            file_state = upload_result.get("file", {}).get("state", "")
-                            
-                            logger.info(f"File uploaded: name={uploaded_file_name}, uri={uploaded_file_uri}, state={file_state}")
-                            
-                        except json.JSONDecodeError:
-                            return None, f"❌ 解析上传响应失败\n📝 响应内容: {resp_text[:300]}..."
-                            
+                    upload_response = await self._upload_from_file(session, upload_url, file_path, timeout)
                 except asyncio.TimeoutError:
                     return None, f"❌ 文件上传超时\n📝 超时时间: {timeout}秒\n📝 文件大小: {file_size_mb:.2f}MB\n💡 提示: 请尝试增加超时时间或使用较小的视频。"
                 
-                # Step 2: 等待文件处理完成
-                if uploaded_file_name:
-                    max_wait_time = timeout
-                    wait_interval = 5
-                    total_waited = 0
+            resp_status, resp_body, uploaded_bytes = upload_response
+            if resp_status != 200:
+                error_msg = f"❌ 文件上传失败\n📝 HTTP状态码: {resp_status}\n📝 已上传: {uploaded_bytes}/{file_size} 字节\n💬 响应: {resp_body[:500].decode('utf-8', errors='replace')}\n"
+                if resp_status == 400:
+                    error_msg += "💡 提示: 请求格式错误，可能是视频格式不支持。"
+                elif resp_status == 413:
+                    error_msg += "💡 提示: 文件过大，请尝试使用较小的视频。"
+                elif resp_status == 401:
+                    error_msg += "💡 提示: API Key 无效，请检查配置。"
+                return None, error_msg
+                
+            try:
+                upload_result = json_loads(resp_body)
+                uploaded_file_name = upload_result.get("file", {}).get("name", "")
+                uploaded_file_uri = upload_result.get("file", {}).get("uri", "")
+                file_state = upload_result.get("file", {}).get("state", "")
                     
-                    while total_waited < max_wait_time:
-                        check_url = f"{api_base}/v1beta/{uploaded_file_name}?key={api_key}"
+                logger.info(f"File uploaded: name={uploaded_file_name}, uri={uploaded_file_uri}, state={file_state}")
+                    
+            except ValueError:
+                return None, f"❌ 解析上传响应失败\n📝 响应内容: {resp_body[:300].decode('utf-8', errors='replace')}..."
+                
+            # Step 2: 等待文件处理完成
+            # 上传响应中已为 ACTIVE 时无需轮询；否则按指数退避（带抖动）轮询文件状态
+            if uploaded_file_name and file_state == "FAILED":
+                error_detail = upload_result.get("file", {}).get("error", {})
+                return None, f"❌ 文件处理失败\n📝 状态: {file_state}\n💬 错误: {error_detail}\n💡 提示: 视频格式可能不支持，请尝试 MP4 格式。"
+                
+            if uploaded_file_name and file_state != "ACTIVE":
+                max_wait_time = timeout
+                wait_interval = 0.5
+                total_waited = 0.0
+                is_active = False
+                    
+                while total_waited < max_wait_time:
+                    await asyncio.sleep(wait_interval)
+                    total_waited += wait_interval
+                    wait_interval = min(wait_interval * 1.7 + random.uniform(0, 0.3), 15.0)
                         
-                        try:
-                            async with session.get(check_url, timeout=aiohttp.ClientTimeout(total=30)) as resp:
-                                if resp.status == 200:
-                                    status_result = await resp.json()
-                                    file_state = status_result.get("state", "")
+                    check_url = f"{api_base}/v1beta/{uploaded_file_name}?key={api_key}"
+                        
+                    try:
+                        async with session.get(check_url, timeout=aiohttp.ClientTimeout(total=30)) as resp:
+                            if resp.status == 200:
+                                status_result = await resp.json(loads=json_loads)
+                                file_state = status_result.get("state", "")
                                     
-                                    logger.info(f"File state: {file_state} (waited {total_waited}s)")
+                                logger.info(f"File state: {file_state} (waited {total_waited:.1f}s)")
                                     
-                                    if file_state == "ACTIVE":
-                                        break
-                                    elif file_state == "FAILED":
-                                        error_detail = status_result.get("error", {})
-                                        return None, f"❌ 文件处理失败\n📝 状态: {file_state}\n💬 错误: {error_detail}\n💡 提示: 视频格式可能不支持，请尝试 MP4 格式。"
+                                if file_state == "ACTIVE":
+                                    is_active = True
+                                    break
+                                elif file_state == "FAILED":
+                                    error_detail = status_result.get("error", {})
+                                    return None, f"❌ 文件处理失败\n📝 状态: {file_state}\n💬 错误: {error_detail}\n💡 提示: 视频格式可能不支持，请尝试 MP4 格式。"
                                     
-                        except Exception as e:
-                            logger.warning(f"Error checking file status: {e}")
-                        
-                        await asyncio.sleep(wait_interval)
-                        total_waited += wait_interval
+                    except Exception as e:
+                        logger.warning(f"Error checking file status: {e}")
                     
-                    if total_waited >= max_wait_time:
-                        return None, f"❌ 等待文件处理超时\n📝 已等待: {total_waited}秒\n💡 提示: 视频可能过大，处理时间过长。请尝试较短的视频或增加超时时间。"
-                
-                # Step 3: 调用生成接口
-                generate_url = f"{api_base}/v1beta/models/{model_id}:generateContent?key={api_key}"
-                
-                payload = {
-                    "contents": [{
-                        "parts": [
-                            {"text": prompt},
-                            {
-                                "file_data": {
-                                    "mime_type": mime_type,
-                                    "file_uri": uploaded_file_uri
-                                }
-                            }
-                        ]
-                    }]
-                }
+                if not is_active:
+                    return None, f"❌ 等待文件处理超时\n📝 已等待: {total_waited:.0f}秒\n💡 提示: 视频可能过大，处理时间过长。请尝试较短的视频或增加超时时间。"
                 
-                logger.info(f"Calling generateContent with file_uri: {uploaded_file_uri}")
+            # 上传成功的文件记录到缓存，相同内容的视频在有效期内可直接复用
+            if reuse_files and uploaded_file_uri:
+                if file_sha is None:
+                    file_sha = await asyncio.to_thread(_sha256_file, file_path)
+                await self._store_cached_file(
+                    _uri_cache_key(api_base, api_key, file_sha), uploaded_file_name, uploaded_file_uri
+                )
+                keep_uploaded_file = True
                 
-                try:
-                    async with session.post(
-                        generate_url,
-                        json=payload,
-                        timeout=aiohttp.ClientTimeout(total=timeout)
-                    ) as resp:
-                        resp_text = await resp.text()
-                        
-                        if resp.status != 200:
-                            try:
-                                error_json = json.loads(resp_text)
-                                error_message = error_json.get("error", {}).get("message", resp_text)
-                                error_code = error_json.get("error", {}).get("code", resp.status)
-                            except:
-                                error_message = resp_text[:500]
-                                error_code = resp.status
-                            
-                            return None, f"❌ Gemini API 请求失败\n📝 HTTP状态码: {resp.status}\n📝 错误代码: {error_code}\n💬 错误信息: {error_message}"
-                        
-                        # 解析响应
-                        return self._parse_generate_response(resp_text, model_id)
-                        
-                except asyncio.TimeoutError:
-                    return None, f"❌ 生成请求超时\n📝 超时时间: {timeout}秒\n💡 提示: 视频可能过大，处理时间过长。"
+            # Step 3: 调用生成接口
+            result_text, error_info, _ = await self._generate_with_file_uri(
+                session, api_base, api_key, model_id, mime_type, uploaded_file_uri, prompt, timeout
+            )
+            return result_text, error_info
                     
         except aiohttp.ClientError as e:
             return None, f"❌ 网络请求错误\n🔴 错误类型: {type(e).__name__}\n💬 错误信息: {e}\n💡 提示: 请检查网络连接和 API 地址配置。"
         except Exception as e:
             return None, f"❌ File API 调用异常\n🔴 错误类型: {type(e).__name__}\n💬 错误信息: {e}\n📝 API地址: {api_base}\n📝 模型: {model_id}"
         finally:
-            # 尝试删除上传的文件（可选，失败不影响结果）
-            if uploaded_file_name:
+            # 尝试删除上传的文件（可选，失败不影响结果；已记录供复用的文件保留）
+            # 删除请求在后台进行，不阻塞结果返回
+            if uploaded_file_name and not keep_uploaded_file:
+                self.plugin.create_background_task(
+                    self._delete_uploaded_file(api_base, api_key, uploaded_file_name)
+                )
+
+    async def _discard_upload_session(self, upload_init: asyncio.Task):
+        """等待上传初始化完成后取消其建立的 resumable 上传会话（会话最终未被使用时），失败时仅记录日志"""
+        if upload_init.cancelled():
+            return
+        try:
+            upload_url, _ = await upload_init
+            if not upload_url:
+                return
+            session = self.plugin.get_http_session()
+            async with session.post(
+                upload_url,
+                headers={'X-Goog-Upload-Command': 'cancel'},
+                timeout=aiohttp.ClientTimeout(total=10)
+            ) as resp:
+                logger.debug(f"Cancelled unused upload session: HTTP {resp.status}")
+        except Exception as e:
+            logger.debug(f"Error cancelling upload session: {e}")
+
+    async def _delete_uploaded_file(self, api_base: str, api_key: str, file_name: str):
+        """删除已上传到 File API 的文件，失败时仅记录日志"""
+        try:
+            delete_url = f"{api_base}/v1beta/{file_name}?key={api_key}"
+            session = self.plugin.get_http_session()
+            async with session.delete(delete_url, timeout=aiohttp.ClientTimeout(total=10)) as resp:
+                if resp.status == 200:
+                    logger.info(f"Deleted uploaded file: {file_name}")
+                else:
+                    logger.debug(f"Failed to delete uploaded file: {resp.status}")
+        except Exception as e:
+            logger.debug(f"Error deleting uploaded file: {e}")
+
+    async def _generate_with_file_uri(self, session: aiohttp.ClientSession, api_base: str, api_key: str,
+                                      model_id: str, mime_type: str, file_uri: str, prompt: str,
+                                      timeout: int) -> Tuple[Optional[str], Optional[str], int]:
+        """使用已上传文件的 file_uri 调用 generateContent 接口
+        
+        Returns:
+            tuple: (result_text, error_info, HTTP状态码)
+        """
+        generate_url = f"{api_base}/v1beta/models/{model_id}:generateContent?key={api_key}"
+        
+        payload = {
+            "contents": [{
+                "parts": [
+                    {"text": prompt},
+                    {
+                        "file_data": {
+                            "mime_type": mime_type,
+                            "file_uri": file_uri
+                        }
+                    }
+                ]
+            }]
+        }
+        
+        logger.info(f"Calling generateContent with file_uri: {file_uri}")
+        
+        try:
+            async with session.post(
+                generate_url,
+                data=json_dumps(payload).encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+                timeout=aiohttp.ClientTimeout(total=timeout)
+            ) as resp:
+                resp_body = await resp.read()
+                
+                if resp.status != 200:
+                    # 解析错误响应
+                    error_code, error_message = _extract_gemini_error(resp_body, resp.status)
+                    
+                    return None, f"❌ Gemini API 请求失败\n📝 HTTP状态码: {resp.status}\n📝 错误代码: {error_code}\n💬 错误信息: {error_message}", resp.status
+                
+                # 解析响应
+                result_text, error_info = self._parse_generate_response(resp_body, model_id)
+                return result_text, error_info, resp.status
+                
+        except asyncio.TimeoutError:
+            return None, f"❌ 生成请求超时\n📝 超时时间: {timeout}秒\n💡 提示: 视频可能过大，处理时间过长。", 0
+
+    def _get_uri_cache_path(self) -> str:
+        """获取已上传文件缓存的持久化路径"""
+        return os.path.join(get_astrbot_data_path(), "qq_tools", "uri_cache.json")
+
+    async def _load_uri_cache(self) -> Dict[str, Dict]:
+        """加载已上传文件缓存（首次使用时从磁盘读取）"""
+        if self._uri_cache is None:
+            def _load():
                 try:
-                    delete_url = f"{api_base}/v1beta/{uploaded_file_name}?key={api_key}"
-                    async with aiohttp.ClientSession() as session:
-                        async with session.delete(delete_url, timeout=aiohttp.ClientTimeout(total=10)) as resp:
-                            if resp.status == 200:
-                                logger.info(f"Deleted uploaded file: {uploaded_file_name}")
-                            else:
-                                logger.debug(f"Failed to delete uploaded file: {resp.status}")
+                    with open(self._get_uri_cache_path(), 'r', encoding='utf-8') as f:
+                        return json.load(f)
+                except (OSError, ValueError):
+                    return {}
+            self._uri_cache = await asyncio.to_thread(_load)
+        return self._uri_cache
+
+    async def _save_uri_cache(self):
+        """将已上传文件缓存写入磁盘，顺带移除已过期的条目"""
+        now = time.time()
+        cache = {k: v for k, v in self._uri_cache.items() if v.get("exp", 0) > now}
+        self._uri_cache = cache
+        
+        def _save():
+            path = self._get_uri_cache_path()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(cache, f)
+        try:
+            await asyncio.to_thread(_save)
+        except Exception as e:
+            logger.warning(f"Failed to save uploaded file cache: {e}")
+
+    async def _get_cached_file_uri(self, cache_key: str) -> Optional[str]:
+        """查询相同内容视频已上传到 File API 的 file_uri（距过期不足 1 小时的视为失效）"""
+        entry = (await self._load_uri_cache()).get(cache_key)
+        if entry and time.time() < entry.get("exp", 0) - 3600:
+            return entry.get("uri")
+        return None
+
+    async def _store_cached_file(self, cache_key: str, file_name: str, file_uri: str):
+        """记录已上传文件，File API 上传的文件保留 48 小时"""
+        cache = await self._load_uri_cache()
+        cache[cache_key] = {"uri": file_uri, "name": file_name, "exp": time.time() + _FILE_API_TTL}
+        await self._save_uri_cache()
+
+    async def _drop_cached_file(self, cache_key: str):
+        """移除失效的已上传文件记录"""
+        cache = await self._load_uri_cache()
+        if cache.pop(cache_key, None) is not None:
+            await self._save_uri_cache()
+
+    async def _upload_from_file(self, session: aiohttp.ClientSession, upload_url: str, file_path: str,
+                                timeout: int, progress: Optional["_DownloadProgress"] = None) -> Tuple[int, bytes, int]:
+        """将文件按块上传到 resumable 上传会话
+        
+        中间块使用 upload 命令，最后一块使用 upload, finalize；单块失败时仅重传该块。
+        传入 progress 时文件仍在下载中，会随下载进度边读边传，直到下载完成后发送最后一块。
+        
+        Returns:
+            tuple: (最后一次请求的 HTTP 状态码, 响应体原始字节, 已上传字节数)
+        """
+        chunk_size = max(1, int(self.config.get("upload_chunk_size", 8))) * 1024 * 1024
+        
+        if progress is None:
+            progress = _DownloadProgress()
+            progress.advance(await asyncio.to_thread(os.path.getsize, file_path))
+            progress.finish()
+        
+        offset = 0
+        f = await asyncio.to_thread(open, file_path, 'rb')
+        try:
+            while True:
+                # 至少多于一个块的数据就绪时才发送中间块，保证最后总留有数据用于 finalize
+                while not progress.done and progress.written - offset <= chunk_size:
+                    await progress.wait()
+                if progress.failed:
+                    return 0, "视频下载未完成，已中止上传".encode(), offset
+                
+                is_last = progress.done and progress.written - offset <= chunk_size
+                chunk = await asyncio.to_thread(f.read, chunk_size)
+                resp_status, resp_body = await self._upload_chunk(
+                    session, upload_url, chunk, offset, is_last, timeout
+                )
+                if resp_status != 200:
+                    return resp_status, resp_body, offset
+                offset += len(chunk)
+                if is_last:
+                    return resp_status, resp_body, offset
+                logger.debug(f"Uploaded {offset} bytes")
+        finally:
+            await asyncio.to_thread(f.close)
+
+    async def _pipeline_upload(self, upload_init: asyncio.Task, file_path: str, timeout: int,
+                               progress: "_DownloadProgress") -> Tuple[Optional[Tuple[int, bytes, int]], Optional[str]]:
+        """边下载边上传：等待上传会话初始化完成后，跟随下载进度上传文件
+        
+        Returns:
+            tuple: (upload_response, error_info) - upload_response 同 _upload_from_file 的返回值
+        """
+        # shield: 上传被取消时初始化请求仍继续完成，以便随后取消其建立的会话
+        upload_url, error_msg = await asyncio.shield(upload_init)
+        if error_msg:
+            return None, error_msg
+        
+        session = self.plugin.get_http_session()
+        return await self._upload_from_file(session, upload_url, file_path, timeout, progress), None
+
+    async def _upload_chunk(self, session: aiohttp.ClientSession, upload_url: str, chunk: bytes,
+                            offset: int, is_last: bool, timeout: int) -> Tuple[int, bytes]:
+        """向 resumable 上传会话发送一个数据块，网络错误或服务端错误时按指数退避重试
+        
+        重试前会先查询服务端已接收的字节数，若该块实际已送达则不再重复发送。
+        
+        Returns:
+            tuple: (HTTP状态码, 响应体原始字节)
+        """
+        headers = {
+            'Content-Length': str(len(chunk)),
+            'X-Goog-Upload-Offset': str(offset),
+            'X-Goog-Upload-Command': 'upload, finalize' if is_last else 'upload',
+        }
+        
+        delay = 1.0
+        for attempt in range(_UPLOAD_CHUNK_RETRIES + 1):
+            try:
+                async with session.post(
+                    upload_url,
+                    headers=headers,
+                    data=chunk,
+                    timeout=aiohttp.ClientTimeout(total=timeout)
+                ) as resp:
+                    resp_body = await resp.read()
+                    if resp.status < 500 or attempt == _UPLOAD_CHUNK_RETRIES:
+                        return resp.status, resp_body
+                    logger.warning(f"Chunk upload at offset {offset} failed with HTTP {resp.status}, retrying...")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt == _UPLOAD_CHUNK_RETRIES:
+                    raise
+                logger.warning(f"Chunk upload at offset {offset} failed: {e}, retrying...")
+            
+            await asyncio.sleep(delay)
+            delay *= 2
+            
+            # 查询服务端已接收的字节数，判断该块是否其实已经送达
+            if not is_last:
+                try:
+                    async with session.post(
+                        upload_url,
+                        headers={'X-Goog-Upload-Command': 'query'},
+                        timeout=aiohttp.ClientTimeout(total=30)
+                    ) as resp:
+                        received = resp.headers.get('X-Goog-Upload-Size-Received')
+                        if received and int(received) >= offset + len(chunk):
+                            return 200, b""
                 except Exception as e:
-                    logger.debug(f"Error deleting uploaded file: {e}")
+                    logger.debug(f"Failed to query upload status: {e}")
+        
+        return 0, b""
 
     async def _process_with_inline_base64(self, api_base: str, api_key: str, model_id: str,
                                           file_path: str, prompt: str, timeout: int) -> Tuple[Optional[str], Optional[str]]:
-        """读取文件并转换为 Base64，使用 inlineData 上传到 Gemini 并生成内容
+        """将视频以 Base64 编码后通过 inlineData 上传到 Gemini 并生成内容
+
+        请求体以流的形式发送：视频按块读取并编码，不会在内存中保留完整的视频或 Base64 字符串。
         
         Returns:
             tuple: (result_text, error_info) - 成功时 error_info 为 None，失败时 result_text 为 None
         """
         
-        # 1. Read and Encode File
+        # 1. Check File
         try:
-            file_size = os.path.getsize(file_path)
+            file_size = await asyncio.to_thread(os.path.getsize, file_path)
             file_size_mb = file_size / 1024 / 1024
             logger.info(f"Encoding video file: {file_path} ({file_size_mb:.2f}MB)")
-            
-            with open(file_path, "rb") as video_file:
-                video_data = video_file.read()
-                base64_data = base64.b64encode(video_data).decode("utf-8")
-                
-            base64_size_mb = len(base64_data) / 1024 / 1024
-            logger.info(f"Base64 encoded size: {base64_size_mb:.2f}MB")
-            
-        except MemoryError as e:
-            error_msg = f"❌ 内存不足\n📝 原因: 视频文件过大，无法加载到内存进行 Base64 编码\n📝 文件大小: {file_size_mb:.2f}MB\n💡 提示: 请使用较小的视频文件（建议小于 50MB）。"
-            return None, error_msg
         except Exception as e:
             error_msg = f"❌ 读取视频文件失败\n🔴 错误类型: {type(e).__name__}\n💬 错误信息: {e}\n📝 文件路径: {file_path}"
             return None, error_msg
+        
+        # 编码前检查请求大小，超出限制时无需读取和编码视频
+        if (file_size + 2) // 3 * 4 > _INLINE_MAX_BYTES:
+            return None, (
+                f"❌ 视频文件过大，无法使用 inlineData 上传\n📝 文件大小: {file_size_mb:.2f}MB\n"
+                f"📝 Base64 编码后限制: {_INLINE_MAX_BYTES // 1024 // 1024}MB\n"
+                f"💡 提示: 请将 upload_mode 设置为 file_api，或使用较小的视频。"
+            )
 
         # 2. Generate Content with inlineData
         generate_url = f"{api_base}/v1beta/models/{model_id}:generateContent?key={api_key}"
         mime_type = self._get_mime_type(file_path)
         
-        payload = {
-            "contents": [{
-                "parts": [
-                    {"text": prompt},
-                    {
-                        "inline_data": {
-                            "mime_type": mime_type,
-                            "data": base64_data
-                        }
-                    }
-                ]
-            }]
-        }
+        # 请求体结构: {"contents":[{"parts":[{"text":...},{"inline_data":{"mime_type":...,"data":"<base64>"}}]}]}
+        # base64 数据之外的部分预先序列化，视频数据在发送时逐块编码填入
+        body_head = (
+            '{"contents":[{"parts":[{"text":' + json_dumps(prompt)
+            + '},{"inline_data":{"mime_type":' + json_dumps(mime_type) + ',"data":"'
+        ).encode("utf-8")
+        body_tail = b'"}}]}]}'
+        encoded_size = (file_size + 2) // 3 * 4
+        logger.info(f"Base64 encoded size: {encoded_size / 1024 / 1024:.2f}MB")
+
+        async def body_stream():
+            yield body_head
+            if file_size:
+                # 以只读方式映射文件，各块在编码线程中从映射复制并编码
+                f, mm = await asyncio.to_thread(_mmap_file, file_path)
+                try:
+                    for offset in range(0, file_size, _B64_ENCODE_BLOCK):
+                        yield await asyncio.to_thread(_b64_encode_mmap_block, mm, offset)
+                finally:
+                    mm.close()
+                    f.close()
+            yield body_tail
         
         try:
-            async with aiohttp.ClientSession() as session:
-                logger.info(f"Sending request to Gemini API: {model_id}, timeout={timeout}s")
+            session = self.plugin.get_http_session()
+            logger.info(f"Sending request to Gemini API: {model_id}, timeout={timeout}s")
                 
-                try:
-                    async with session.post(
-                        generate_url,
-                        json=payload,
-                        timeout=aiohttp.ClientTimeout(total=timeout)
-                    ) as resp:
-                        resp_text = await resp.text()
+            try:
+                async with session.post(
+                    generate_url,
+                    data=body_stream(),
+                    headers={
+                        "Content-Type": "application/json",
+                        "Content-Length": str(len(body_head) + encoded_size + len(body_tail)),
+                    },
+                    timeout=aiohttp.ClientTimeout(total=timeout)
+                ) as resp:
+                    resp_body = await resp.read()
                         
-                        if resp.status != 200:
-                            # 解析错误响应
-                            try:
-                                error_json = json.loads(resp_text)
-                                error_message = error_json.get("error", {}).get("message", resp_text)
-                                error_code = error_json.get("error", {}).get("code", resp.status)
-                            except:
-                                error_message = resp_text[:500]
-                                error_code = resp.status
+                    if resp.status != 200:
+                        # 解析错误响应
+                        error_code, error_message = _extract_gemini_error(resp_body, resp.status)
                             
-                            error_msg = f"❌ Gemini API 请求失败\n📝 HTTP状态码: {resp.status}\n📝 错误代码: {error_code}\n💬 错误信息: {error_message}\n"
+                        error_msg = f"❌ Gemini API 请求失败\n📝 HTTP状态码: {resp.status}\n📝 错误代码: {error_code}\n💬 错误信息: {error_message}\n"
                             
-                            # 添加针对性提示
-                            if resp.status == 400:
-                                error_msg += "💡 提示: 请求格式错误，可能是视频格式不支持或文件损坏。"
-                            elif resp.status == 401:
-                                error_msg += "💡 提示: API Key 无效，请检查配置。"
-                            elif resp.status == 403:
-                                error_msg += "💡 提示: API Key 没有访问权限，或该地区不支持此服务。"
-                            elif resp.status == 404:
-                                error_msg += f"💡 提示: 模型 {model_id} 不存在，请检查 model_id 配置。"
-                            elif resp.status == 429:
-                                error_msg += "💡 提示: API 配额已用尽或请求过于频繁，请稍后再试。"
-                            elif resp.status >= 500:
-                                error_msg += "💡 提示: Gemini 服务端错误，请稍后再试。"
+                        # 添加针对性提示
+                        if resp.status == 400:
+                            error_msg += "💡 提示: 请求格式错误，可能是视频格式不支持或文件损坏。"
+                        elif resp.status == 401:
+                            error_msg += "💡 提示: API Key 无效，请检查配置。"
+                        elif resp.status == 403:
+                            error_msg += "💡 提示: API Key 没有访问权限，或该地区不支持此服务。"
+                        elif resp.status == 404:
+                            error_msg += f"💡 提示: 模型 {model_id} 不存在，请检查 model_id 配置。"
+                        elif resp.status == 429:
+                            error_msg += "💡 提示: API 配额已用尽或请求过于频繁，请稍后再试。"
+                        elif resp.status >= 500:
+                            error_msg += "💡 提示: Gemini 服务端错误，请稍后再试。"
                             
-                            return None, error_msg
+                        return None, error_msg
                         
-                        # 解析响应
-                        return self._parse_generate_response(resp_text, model_id)
+                    # 解析响应
+                    return self._parse_generate_response(resp_body, model_id)
                             
-                except asyncio.TimeoutError:
-                    error_msg = f"❌ Gemini API 请求超时\n📝 超时时间: {timeout}秒\n💡 提示: 视频可能过大，处理时间过长。可尝试：\n  1. 使用较小的视频\n  2. 增加 timeout 配置值\n  3. 检查网络连接"
-                    return None, error_msg
+            except asyncio.TimeoutError:
+                error_msg = f"❌ Gemini API 请求超时\n📝 超时时间: {timeout}秒\n💡 提示: 视频可能过大，处理时间过长。可尝试：\n  1. 使用较小的视频\n  2. 增加 timeout 配置值\n  3. 检查网络连接"
+                return None, error_msg
                     
         except aiohttp.ClientError as e:
             error_msg = f"❌ 网络请求错误\n🔴 错误类型: {type(e).__name__}\n💬 错误信息: {e}\n💡 提示: 请检查网络连接和 API 地址配置。"
@@ -947,69 +1645,87 @@ class ViewVideoTool(FunctionTool):
 
     async def _resolve_short_link(self, url: str) -> str:
         """Resolve short link (like b23.tv) to get real URL"""
+        cached = self._short_link_cache.get(url)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                return cached[1]
+            # 短链可能已被重新指向，过期后重新解析
+            del self._short_link_cache[url]
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.head(url, allow_redirects=True, timeout=10) as resp:
-                    return str(resp.url)
-        except:
+            session = self.plugin.get_http_session()
+            async with session.head(url, allow_redirects=True, timeout=aiohttp.ClientTimeout(total=10)) as resp:
+                resolved = str(resp.url)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.debug(f"Failed to resolve short link {url}: {e}")
+            # 解析失败不写入缓存，下次调用时重试
             return url
+        if len(self._short_link_cache) >= _SHORT_LINK_CACHE_MAX:
+            self._short_link_cache.pop(next(iter(self._short_link_cache)))
+        self._short_link_cache[url] = (time.monotonic() + _SHORT_LINK_CACHE_TTL, resolved)
+        return resolved
 
     def _parse_bilibili_input(self, text: str) -> Tuple[Optional[str], Optional[str], int]:
         """Parse input text to get bvid or aid, and p"""
         p = 1
         
-        # Extract P from text if exists ?p=2 or &p=2
-        p_match = re.search(r"[?&]p=(\d+)", text)
-        if p_match:
+        # 输入包含 B站链接时只解析其查询串中的 p，否则回退为在文本中查找 ?p=2 / &p=2
+        url_match = _BILI_URL_RE.search(text) if "://" in text else None
+        if url_match:
+            p_values = urllib.parse.parse_qs(urllib.parse.urlsplit(url_match.group(0)).query).get("p")
+            p_str = p_values[0] if p_values else None
+        else:
+            p_match = _BILI_P_RE.search(text)
+            p_str = p_match.group(1) if p_match else None
+        if p_str:
             try:
-                p = int(p_match.group(1))
-            except:
+                p = int(p_str)
+            except ValueError:
                 pass
 
-        # Try extract BV
-        bv_match = re.search(r"(BV[0-9A-Za-z]{10})", text, re.I)
-        if bv_match:
-            return bv_match.group(1), None, p
-        
-        # Try extract av
-        av_match = re.search(r"(?:av)(\d+)", text, re.I)
-        if av_match:
-            return None, av_match.group(1), p
+        # Try extract BV / av (BV 号优先，文本中任意位置的 BV 号都优先于 av 号)
+        aid = None
+        for m in _BV_AV_RE.finditer(text):
+            if m.group('bv'):
+                return m.group('bv'), None, p
+            if aid is None:
+                aid = m.group('av')
+        if aid:
+            return None, aid, p
             
-        # Try extract URL
-        url_match = re.search(r"(https?://(?:www\.|m\.|)bilibili\.com/[^ \n]+|https?://b23\.tv/[^ \n]+)", text)
+        # Try extract URL（已在解析 p 时查找过）
         if url_match:
-            url = url_match.group(1)
+            url = url_match.group(0)
             return "URL:" + url, None, p
             
         return None, None, p
 
     def _get_mixin_key(self, orig: str) -> str:
         """WBI signature mixin key generation"""
-        mixin_key_enc_tab = [
-            46, 47, 18, 2, 53, 8, 23, 32, 15, 50, 10, 31, 58, 3, 45, 35, 27, 43, 5, 49,
-            33, 9, 42, 19, 29, 28, 14, 39, 12, 38, 41, 13, 37, 48, 7, 16, 24, 55, 40,
-            61, 26, 17, 0, 1, 60, 51, 30, 4, 22, 25, 54, 21, 56, 59, 6, 63, 57, 62, 11,
-            36, 20, 34, 44, 52
-        ]
-        return reduce(lambda s, i: s + orig[i], mixin_key_enc_tab, "")[:32]
-
-    def _enc_wbi(self, params: Dict, img_key: str, sub_key: str) -> Dict:
+        return "".join(orig[i] for i in _MIXIN_KEY_ENC_TAB[:32])
+
+    def _enc_wbi(self, params: Dict, mixin_key: str) -> Dict:
         """Sign params with WBI"""
-        mixin_key = self._get_mixin_key(img_key + sub_key)
-        curr_time = round(time.time())
-        params['wts'] = curr_time
-        params = dict(sorted(params.items()))
-        # Filter invalid chars
-        params = {
-            k: ''.join(filter(lambda c: c not in "!'()*", str(v)))
-            for k, v in params.items()
-        }
-        query = urllib.parse.urlencode(params)
-        w_rid = hashlib.md5((query + mixin_key).encode()).hexdigest()
-        params['w_rid'] = w_rid
+        params['wts'] = int(time.time())
+        # Sort and filter invalid chars
+        params = {k: str(v).translate(_WBI_STRIP_TABLE) for k, v in sorted(params.items())}
+        h = hashlib.md5(urllib.parse.urlencode(params).encode(), usedforsecurity=False)
+        h.update(mixin_key.encode())
+        params['w_rid'] = h.hexdigest()
         return params
 
+    async def _get_wbi_mixin_key(self, session: aiohttp.ClientSession) -> str:
+        """获取 WBI 签名用的 mixin key，有效期内复用缓存，避免每次都请求 nav 接口"""
+        if self._wbi_cache and self._wbi_cache[1] > time.monotonic():
+            return self._wbi_cache[0]
+        async with self._wbi_lock:
+            # 等待锁期间其他请求可能已完成刷新
+            if self._wbi_cache and self._wbi_cache[1] > time.monotonic():
+                return self._wbi_cache[0]
+            img_key, sub_key = await self._get_wbi_keys(session)
+            mixin_key = self._get_mixin_key(img_key + sub_key)
+            self._wbi_cache = (mixin_key, time.monotonic() + _WBI_KEYS_TTL)
+            return mixin_key
+
     async def _get_wbi_keys(self, session: aiohttp.ClientSession) -> Tuple[str, str]:
         """Get WBI keys from nav endpoint"""
         headers = {
@@ -1032,80 +1748,82 @@ class ViewVideoTool(FunctionTool):
             'Referer': 'https://www.bilibili.com/'
         }
         
-        async with aiohttp.ClientSession() as session:
-            # 1. View API
-            params = {}
-            if bvid: params['bvid'] = bvid
-            if aid: params['aid'] = aid
+        session = self.plugin.get_http_session()
+        # 1. View API
+        params = {}
+        if bvid: params['bvid'] = bvid
+        if aid: params['aid'] = aid
             
-            async with session.get("https://api.bilibili.com/x/web-interface/view", params=params, headers=headers) as resp:
-                view_data = await resp.json()
-                if view_data['code'] != 0:
-                    raise Exception(f"B站API错误: {view_data['message']}")
+        async with session.get("https://api.bilibili.com/x/web-interface/view", params=params, headers=headers) as resp:
+            view_data = await resp.json()
+            if view_data['code'] != 0:
+                raise Exception(f"B站API错误: {view_data['message']}")
                 
-                data = view_data['data']
-                title = data['title']
-                desc = data['desc']
-                duration = data['duration'] # seconds
-                pages = data.get('pages', [])
-                owner_name = data.get('owner', {}).get('name', 'Unknown')
+            data = view_data['data']
+            title = data['title']
+            desc = data['desc']
+            duration = data['duration'] # seconds
+            pages = data.get('pages', [])
+            owner_name = data.get('owner', {}).get('name', 'Unknown')
                 
-                # Check P
-                if p > len(pages):
-                    raise Exception(f"P号超出范围 (最大P{len(pages)})")
+            # Check P
+            if p > len(pages):
+                raise Exception(f"P号超出范围 (最大P{len(pages)})")
                 
-                # Find cid
-                current_page = next((x for x in pages if x['page'] == p), pages[0])
-                cid = current_page['cid']
-                part_name = current_page['part']
+            # Find cid
+            current_page = next((x for x in pages if x['page'] == p), pages[0])
+            cid = current_page['cid']
+            part_name = current_page['part']
                 
-                # If duration in part is available, use it (sometimes main duration is total?)
-                if 'duration' in current_page:
-                    duration = current_page['duration']
+            # If duration in part is available, use it (sometimes main duration is total?)
+            if 'duration' in current_page:
+                duration = current_page['duration']
 
-            # 2. Get WBI Keys
-            try:
-                img_key, sub_key = await self._get_wbi_keys(session)
-            except Exception as e:
-                logger.warning(f"Failed to get WBI keys: {e}, will try unsigned playurl")
-                img_key, sub_key = None, None
-
-            # 3. PlayURL
-            play_params = {
-                'bvid': bvid or "",
-                'cid': cid,
-                'qn': qn,
-                'fnval': 1, # mp4
-                'fnver': 0,
-                'fourk': 1
-            }
-            if aid: play_params['avid'] = aid
+        # 2. Get WBI Keys
+        try:
+            mixin_key = await self._get_wbi_mixin_key(session)
+        except Exception as e:
+            logger.warning(f"Failed to get WBI keys: {e}, will try unsigned playurl")
+            mixin_key = None
+
+        # 3. PlayURL
+        play_params = {
+            'bvid': bvid or "",
+            'cid': cid,
+            'qn': qn,
+            'fnval': 1, # mp4
+            'fnver': 0,
+            'fourk': 1
+        }
+        if aid: play_params['avid'] = aid
             
-            signed_params = play_params
-            if img_key and sub_key:
-                signed_params = self._enc_wbi(play_params, img_key, sub_key)
+        signed_params = play_params
+        if mixin_key:
+            signed_params = self._enc_wbi(play_params, mixin_key)
             
-            play_url = "https://api.bilibili.com/x/player/wbi/playurl"
+        play_url = "https://api.bilibili.com/x/player/wbi/playurl"
             
-            async with session.get(play_url, params=signed_params, headers=headers) as resp:
-                play_data = await resp.json()
-                if play_data['code'] != 0:
-                    raise Exception(f"获取播放地址失败: {play_data['message']}")
+        async with session.get(play_url, params=signed_params, headers=headers) as resp:
+            play_data = await resp.json()
+            if play_data['code'] != 0:
+                # 密钥可能已轮换，下次重新获取
+                self._wbi_cache = None
+                raise Exception(f"获取播放地址失败: {play_data['message']}")
                 
-                durl = play_data['data']['durl']
-                if not durl:
-                    raise Exception("未找到MP4播放地址")
+            durl = play_data['data']['durl']
+            if not durl:
+                raise Exception("未找到MP4播放地址")
                 
-                video_url = durl[0]['url']
+            video_url = durl[0]['url']
                 
-                return {
-                    'url': video_url,
-                    'title': title,
-                    'desc': desc,
-                    'owner': owner_name,
-                    'duration': duration,
-                    'part': part_name,
-                    'bvid': bvid,
-                    'p': p,
-                    'cid': cid
-                }
+            return {
+                'url': video_url,
+                'title': title,
+                'desc': desc,
+                'owner': owner_name,
+                'duration': duration,
+                'part': part_name,
+                'bvid': bvid,
+                'p': p,
+                'cid': cid
+            }
@@ -114,14 +114,14 @@ class WakeManageTool(FunctionTool):
         )
         
         if success:
-            return f"已成功删除唤醒任务 {task_id[:8]}..."
+            return f"已成功删除唤醒任务 {task_id}"
         else:
             # 检查任务是否存在但属于其他会话
             task = self.plugin.wake_scheduler.get_task(task_id)
             if task:
-                return f"错误：无法删除任务 {task_id[:8]}...（该任务不属于当前会话）"
+                return f"错误：无法删除任务 {task_id}（该任务不属于当前会话）"
             else:
-                return f"错误：未找到任务 {task_id[:8]}..."
+                return f"错误：未找到任务 {task_id}"
     
     async def _handle_clear(self, session_id: str) -> str:
         """清空当前会话的所有唤醒任务"""
@@ -17,6 +17,10 @@ if TYPE_CHECKING:
     from ..main import QQToolsPlugin
 
 
+# 允许的最大延迟时间（秒），即 1 年
+_MAX_DELAY = 31_536_000
+
+
 class WakeScheduleTool(FunctionTool):
     """主动唤醒工具 - 创建定时唤醒任务"""
     
@@ -72,11 +76,10 @@ class WakeScheduleTool(FunctionTool):
         except (ValueError, TypeError):
             return f"错误：延迟时间必须是整数（秒），收到: {delay_time}"
         
-        if delay_time <= 0:
-            return "错误：延迟时间必须大于 0 秒。"
-        
-        if delay_time > 86400 * 365:  # 最大 1 年
-            return "错误：延迟时间不能超过 1 年（31536000 秒）。"
+        if not 0 < delay_time <= _MAX_DELAY:
+            if delay_time <= 0:
+                return "错误：延迟时间必须大于 0 秒。"
+            return f"错误：延迟时间不能超过 1 年（{_MAX_DELAY} 秒）。"
         
         # 获取会话信息
         session_id = event.unified_msg_origin
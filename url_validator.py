@@ -12,13 +12,50 @@ import asyncio
 import ipaddress
 import socket
 import re
+import time
 import fnmatch
-from typing import Tuple, List, Optional, Set
-from urllib.parse import urlparse
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Tuple, List, Optional, Set
+from urllib.parse import urlparse, scheme_chars
 
 from astrbot.api import logger
 
 
+def _build_prefix_table(networks) -> Tuple[Tuple[int, Dict[int, str]], ...]:
+    """将网络列表按前缀长度分组，构建最长前缀匹配用的查找表
+
+    每组为 (右移位数, {网络前缀整数: 网络描述})，按前缀长度从长到短排列。
+    """
+    groups: Dict[int, Dict[int, str]] = {}
+    for network in networks:
+        shift = network.max_prefixlen - network.prefixlen
+        groups.setdefault(shift, {})[int(network.network_address) >> shift] = str(network)
+    return tuple(sorted(groups.items()))
+
+
+def _lookup_prefix_table(table: Tuple[Tuple[int, Dict[int, str]], ...], ip_int: int) -> Optional[str]:
+    """在查找表中查找包含该地址的网络，返回网络描述，未命中返回 None"""
+    for shift, prefixes in table:
+        network = prefixes.get(ip_int >> shift)
+        if network is not None:
+            return network
+    return None
+
+
+# 域名字典树节点上的标记：该节点对应的域名本身被匹配 / 其任意子域名被匹配
+_TRIE_EXACT = object()
+_TRIE_WILDCARD = object()
+
+# DNS 解析结果缓存的有效期（秒）与容量上限
+_DNS_CACHE_TTL = 300
+_DNS_CACHE_MAX = 1024
+
+# 验证通过的 URL 结果缓存的有效期（秒）与容量上限
+_RESULT_CACHE_TTL = 60
+_RESULT_CACHE_MAX = 1024
+
+
 class URLValidationError(Exception):
     """URL 验证失败异常"""
     pass
@@ -40,7 +77,7 @@ class URLValidator:
     
     # 私有/保留 IP 范围
     # IPv4
-    PRIVATE_IPV4_NETWORKS = [
+    PRIVATE_IPV4_NETWORKS = (
         ipaddress.ip_network('127.0.0.0/8'),      # Loopback
         ipaddress.ip_network('10.0.0.0/8'),       # Private-Use
         ipaddress.ip_network('172.16.0.0/12'),    # Private-Use
@@ -55,10 +92,10 @@ class URLValidator:
         ipaddress.ip_network('224.0.0.0/4'),      # Multicast
         ipaddress.ip_network('240.0.0.0/4'),      # Reserved for Future Use
         ipaddress.ip_network('255.255.255.255/32'),  # Limited Broadcast
-    ]
+    )
     
     # IPv6
-    PRIVATE_IPV6_NETWORKS = [
+    PRIVATE_IPV6_NETWORKS = (
         ipaddress.ip_network('::1/128'),          # Loopback
         ipaddress.ip_network('::/128'),           # Unspecified
         ipaddress.ip_network('::ffff:0:0/96'),    # IPv4-mapped (需要检查映射的 IPv4)
@@ -68,17 +105,22 @@ class URLValidator:
         ipaddress.ip_network('100::/64'),         # Discard-Only
         ipaddress.ip_network('2001:db8::/32'),    # Documentation
         ipaddress.ip_network('2001::/32'),        # Teredo (可能被滥用)
-    ]
+    )
+    
+    # 按前缀长度分组的查找表，每次检查只需对每种前缀长度做一次字典查找
+    _PRIVATE_IPV4_TABLE = _build_prefix_table(PRIVATE_IPV4_NETWORKS)
+    _PRIVATE_IPV6_TABLE = _build_prefix_table(PRIVATE_IPV6_NETWORKS)
     
     # 特别危险的 IP 地址（云服务元数据端点等）
-    DANGEROUS_IPS = {
+    # 各地址表均为不可变类型：_classify_ip 按 IP 字符串缓存结果，依赖它们保持不变
+    DANGEROUS_IPS = frozenset({
         '169.254.169.254',  # AWS, GCP, Azure 等云服务元数据
         '169.254.170.2',    # AWS ECS Task Metadata
         'fd00:ec2::254',    # AWS EC2 IPv6 元数据
-    }
+    })
     
     # 危险的主机名
-    DANGEROUS_HOSTNAMES = {
+    DANGEROUS_HOSTNAMES = frozenset({
         'localhost',
         'localhost.localdomain',
         'ip6-localhost',
@@ -88,7 +130,10 @@ class URLValidator:
         'kubernetes.default',
         'kubernetes.default.svc',
         'kubernetes.default.svc.cluster.local',
-    }
+    })
+    
+    # DNS 解析结果缓存: {hostname: (expire_at, ips)}，所有验证器实例共享
+    _dns_cache: Dict[str, Tuple[float, Tuple[str, ...]]] = {}
     
     def __init__(
         self,
@@ -107,9 +152,36 @@ class URLValidator:
         self.allowed_domains = allowed_domains or []
         self.blocked_domains = blocked_domains or []
         
-        # 预编译域名匹配模式
-        self._allowed_patterns = [self._compile_domain_pattern(d) for d in self.allowed_domains]
-        self._blocked_patterns = [self._compile_domain_pattern(d) for d in self.blocked_domains]
+        # 预编译域名匹配器：(反向域名字典树, 合并后的正则)
+        self._allowed_matcher = self._build_domain_matcher(self.allowed_domains)
+        self._blocked_matcher = self._build_domain_matcher(self.blocked_domains)
+        
+        # 允许私有网络且未配置黑白名单时，只需检查 scheme 和主机名
+        self._unrestricted = allow_private_network and not self.allowed_domains and not self.blocked_domains
+        
+        # 验证通过的 URL 缓存: {url: expire_at}，按 LRU 淘汰
+        self._result_cache: "OrderedDict[str, float]" = OrderedDict()
+    
+    @classmethod
+    def _reject_scheme_fast(cls, url: str) -> Optional[Tuple[bool, str]]:
+        """不解析整个 URL，仅凭协议前缀快速拒绝不允许的协议
+        
+        只处理可以确定结果的情况（不含空白/控制字符、协议名合法且不在允许列表中），
+        其余情况返回 None，交由 urlparse 完整解析。
+        """
+        if url[:8].lower().startswith(('http://', 'https://')):
+            return None
+        if not url or url[0] <= ' ' or '\t' in url or '\r' in url or '\n' in url:
+            return None
+        scheme, sep, _ = url.partition(':')
+        if not sep or not (scheme[:1].isascii() and scheme[:1].isalpha()):
+            return None
+        if any(c not in scheme_chars for c in scheme):
+            return None
+        scheme = scheme.lower()
+        if scheme in cls.ALLOWED_SCHEMES:
+            return None
+        return False, f"不允许的 URL 协议: {scheme}。只允许 http 和 https"
     
     @staticmethod
     def _compile_domain_pattern(domain: str) -> str:
@@ -126,13 +198,61 @@ class URLValidator:
         # 确保完整匹配
         return f'^{pattern}$'
     
-    def _match_domain_pattern(self, hostname: str, patterns: List[str]) -> bool:
-        """检查主机名是否匹配任一模式"""
-        hostname_lower = hostname.lower()
-        for pattern in patterns:
-            if re.match(pattern, hostname_lower, re.IGNORECASE):
+    @staticmethod
+    def _combine_patterns(patterns: List[str]) -> Optional[re.Pattern]:
+        """将多个完整匹配模式合并为一个正则，列表为空时返回 None"""
+        if not patterns:
+            return None
+        # 去掉各模式自身的 ^...$，合并后统一锚定
+        return re.compile(
+            '^(?:' + '|'.join(f'(?:{p[1:-1]})' for p in patterns) + ')$',
+            re.IGNORECASE
+        )
+    
+    @classmethod
+    def _build_domain_matcher(cls, domains: List[str]) -> Tuple[dict, Optional[re.Pattern]]:
+        """构建域名匹配器
+        
+        精确域名和 *.example.com 形式的后缀通配按标签反向插入字典树，
+        其余通配形式（如 example.*）合并为一个正则兜底。
+        """
+        trie: dict = {}
+        regex_patterns = []
+        for domain in domains:
+            domain = domain.lower()
+            if domain.startswith('*.') and '*' not in domain[2:]:
+                labels, marker = domain[2:].split('.'), _TRIE_WILDCARD
+            elif '*' not in domain:
+                labels, marker = domain.split('.'), _TRIE_EXACT
+            else:
+                regex_patterns.append(cls._compile_domain_pattern(domain))
+                continue
+            node = trie
+            for label in reversed(labels):
+                node = node.setdefault(label, {})
+            node[marker] = True
+        return trie, cls._combine_patterns(regex_patterns)
+    
+    def _match_domain_pattern(self, hostname: str, matcher: Tuple[dict, Optional[re.Pattern]]) -> bool:
+        """检查主机名是否匹配域名匹配器中的任一模式"""
+        trie, compiled = matcher
+        hostname = hostname.lower()
+        
+        # 从顶级域开始沿字典树向下查找
+        node = trie
+        labels = hostname.split('.')
+        for i in range(len(labels) - 1, -1, -1):
+            node = node.get(labels[i])
+            if node is None:
+                break
+            # 后缀通配要求前面至少还有一级标签
+            if i > 0 and _TRIE_WILDCARD in node:
                 return True
-        return False
+        else:
+            if _TRIE_EXACT in node:
+                return True
+        
+        return compiled is not None and compiled.match(hostname) is not None
     
     def _is_private_ip(self, ip_str: str) -> Tuple[bool, str]:
         """检查 IP 是否为私有/保留地址
@@ -143,36 +263,20 @@ class URLValidator:
         Returns:
             Tuple[bool, str]: (是否私有, 原因描述)
         """
-        try:
-            ip = ipaddress.ip_address(ip_str)
-        except ValueError:
-            return True, f"无效的 IP 地址: {ip_str}"
-        
-        # 检查特别危险的 IP
-        if ip_str in self.DANGEROUS_IPS:
-            return True, f"拒绝访问危险 IP（云服务元数据端点）: {ip_str}"
-        
-        # 检查 IPv4
-        if isinstance(ip, ipaddress.IPv4Address):
-            for network in self.PRIVATE_IPV4_NETWORKS:
-                if ip in network:
-                    return True, f"拒绝访问私有/保留 IPv4 地址: {ip_str} (属于 {network})"
-            return False, ""
-        
-        # 检查 IPv6
-        if isinstance(ip, ipaddress.IPv6Address):
-            # 检查 IPv4-mapped IPv6 地址
-            if ip.ipv4_mapped:
-                is_private, reason = self._is_private_ip(str(ip.ipv4_mapped))
-                if is_private:
-                    return True, f"IPv4-mapped IPv6 地址包含私有 IP: {reason}"
-            
-            for network in self.PRIVATE_IPV6_NETWORKS:
-                if ip in network:
-                    return True, f"拒绝访问私有/保留 IPv6 地址: {ip_str} (属于 {network})"
-            return False, ""
-        
-        return False, ""
+        return _classify_ip(ip_str)
+    
+    @classmethod
+    def _store_dns_result(cls, hostname: str, ips: Set[str]):
+        """写入 DNS 解析缓存，超出容量时先清理过期条目，仍超出则淘汰最早写入的条目"""
+        cache = cls._dns_cache
+        now = time.monotonic()
+        if len(cache) >= _DNS_CACHE_MAX:
+            for key in [k for k, (expire_at, _) in cache.items() if expire_at <= now]:
+                del cache[key]
+            while len(cache) >= _DNS_CACHE_MAX:
+                cache.pop(next(iter(cache)))
+        cache.pop(hostname, None)
+        cache[hostname] = (now + _DNS_CACHE_TTL, tuple(ips))
     
     async def _resolve_hostname(self, hostname: str) -> List[str]:
         """异步解析主机名到 IP 地址列表
@@ -183,17 +287,29 @@ class URLValidator:
         Returns:
             IP 地址列表
         """
+        entry = self._dns_cache.get(hostname)
+        if entry is not None and entry[0] > time.monotonic():
+            return list(entry[1])
+        
         loop = asyncio.get_event_loop()
         try:
-            # 使用 getaddrinfo 获取所有地址（IPv4 和 IPv6）
-            result = await loop.run_in_executor(
-                None,
-                lambda: socket.getaddrinfo(hostname, None, socket.AF_UNSPEC, socket.SOCK_STREAM)
-            )
+            try:
+                # 数字形式的地址无需 DNS 查询，直接在当前线程解析，省去线程池调度
+                result = socket.getaddrinfo(
+                    hostname, None, socket.AF_UNSPEC, socket.SOCK_STREAM, 0,
+                    socket.AI_NUMERICHOST | socket.AI_NUMERICSERV
+                )
+            except socket.gaierror:
+                # 使用 getaddrinfo 获取所有地址（IPv4 和 IPv6）
+                result = await loop.run_in_executor(
+                    None,
+                    lambda: socket.getaddrinfo(hostname, None, socket.AF_UNSPEC, socket.SOCK_STREAM)
+                )
             # 提取唯一的 IP 地址
             ips = set()
             for family, socktype, proto, canonname, sockaddr in result:
                 ips.add(sockaddr[0])
+            self._store_dns_result(hostname, ips)
             return list(ips)
         except socket.gaierror as e:
             raise URLValidationError(f"DNS 解析失败: {hostname} - {e}")
@@ -209,6 +325,57 @@ class URLValidator:
         Returns:
             Tuple[bool, str]: (是否安全, 消息描述)
         """
+        if self._unrestricted:
+            return await self._validate_url_uncached(url)
+        
+        # 短时间内重复访问的 URL（重试、页面子资源等）直接复用验证结果
+        # 只缓存验证通过的结果，拒绝的结果可能源于临时的 DNS 故障
+        now = time.monotonic()
+        expire_at = self._result_cache.get(url)
+        if expire_at is not None:
+            if expire_at > now:
+                self._result_cache.move_to_end(url)
+                return True, "URL 验证通过"
+            del self._result_cache[url]
+        
+        is_safe, message = await self._validate_url_uncached(url)
+        if is_safe:
+            expire_at = self._result_expiry(url, now)
+            if expire_at is not None:
+                self._result_cache[url] = expire_at
+                if len(self._result_cache) > _RESULT_CACHE_MAX:
+                    self._result_cache.popitem(last=False)
+        return is_safe, message
+    
+    def _result_expiry(self, url: str, now: float) -> Optional[float]:
+        """计算验证通过结果的缓存截止时间，不可缓存时返回 None
+        
+        经过 DNS 检查的结果不超过所检查的 DNS 缓存条目的有效期，避免延长 DNS 重绑定的窗口；
+        DNS 解析失败而放行的结果没有对应的缓存条目，不进行缓存。
+        """
+        expire_at = now + _RESULT_CACHE_TTL
+        if self.allow_private_network:
+            return expire_at
+        
+        hostname = urlparse(url).hostname
+        try:
+            ipaddress.ip_address(hostname)
+            return expire_at
+        except ValueError:
+            pass
+        
+        entry = self._dns_cache.get(hostname)
+        if entry is None or entry[0] <= now:
+            return None
+        return min(expire_at, entry[0])
+    
+    async def _validate_url_uncached(self, url: str) -> Tuple[bool, str]:
+        """执行完整的 URL 验证流程，不使用结果缓存"""
+        # 明显不允许的协议无需完整解析即可拒绝
+        rejected = self._reject_scheme_fast(url)
+        if rejected is not None:
+            return rejected
+        
         # 解析 URL
         try:
             parsed = urlparse(url)
@@ -223,12 +390,13 @@ class URLValidator:
         if scheme not in self.ALLOWED_SCHEMES:
             return False, f"不允许的 URL 协议: {scheme}。只允许 http 和 https"
         
-        # 2. 获取主机名
+        # 2. 获取主机名（urlparse 返回的 hostname 已转为小写）
         hostname = parsed.hostname
         if not hostname:
             return False, "URL 缺少主机名"
         
-        hostname_lower = hostname.lower()
+        if self._unrestricted:
+            return True, "URL 验证通过"
         
         # 3. 检查是否为 IP 地址格式
         is_ip = False
@@ -239,17 +407,17 @@ class URLValidator:
             pass
         
         # 4. 检查黑名单（优先级最高）
-        if self._match_domain_pattern(hostname_lower, self._blocked_patterns):
+        if self._match_domain_pattern(hostname, self._blocked_matcher):
             return False, f"域名 {hostname} 在黑名单中"
         
         # 5. 检查危险主机名
-        if hostname_lower in self.DANGEROUS_HOSTNAMES:
+        if hostname in self.DANGEROUS_HOSTNAMES:
             if not self.allow_private_network:
                 return False, f"拒绝访问危险主机名: {hostname}"
         
         # 6. 检查白名单（如果配置了白名单，则只允许白名单中的域名）
-        if self._allowed_patterns:
-            if not self._match_domain_pattern(hostname_lower, self._allowed_patterns):
+        if self.allowed_domains:
+            if not self._match_domain_pattern(hostname, self._allowed_matcher):
                 return False, f"域名 {hostname} 不在白名单中"
         
         # 7. 如果是 IP 地址，直接检查
@@ -292,6 +460,11 @@ class URLValidator:
         Returns:
             Tuple[bool, str]: (是否通过预检, 消息描述)
         """
+        # 明显不允许的协议无需完整解析即可拒绝
+        rejected = self._reject_scheme_fast(url)
+        if rejected is not None:
+            return rejected
+        
         # 解析 URL
         try:
             parsed = urlparse(url)
@@ -306,25 +479,26 @@ class URLValidator:
         if scheme not in self.ALLOWED_SCHEMES:
             return False, f"不允许的 URL 协议: {scheme}。只允许 http 和 https"
         
-        # 2. 获取主机名
+        # 2. 获取主机名（urlparse 返回的 hostname 已转为小写）
         hostname = parsed.hostname
         if not hostname:
             return False, "URL 缺少主机名"
         
-        hostname_lower = hostname.lower()
+        if self._unrestricted:
+            return True, "预检通过（DNS 验证将在导航时进行）"
         
         # 3. 检查黑名单
-        if self._match_domain_pattern(hostname_lower, self._blocked_patterns):
+        if self._match_domain_pattern(hostname, self._blocked_matcher):
             return False, f"域名 {hostname} 在黑名单中"
         
         # 4. 检查危险主机名
-        if hostname_lower in self.DANGEROUS_HOSTNAMES:
+        if hostname in self.DANGEROUS_HOSTNAMES:
             if not self.allow_private_network:
                 return False, f"拒绝访问危险主机名: {hostname}"
         
         # 5. 检查白名单
-        if self._allowed_patterns:
-            if not self._match_domain_pattern(hostname_lower, self._allowed_patterns):
+        if self.allowed_domains:
+            if not self._match_domain_pattern(hostname, self._allowed_matcher):
                 return False, f"域名 {hostname} 不在白名单中"
         
         # 6. 如果是 IP 地址，检查是否为私有 IP
@@ -340,6 +514,54 @@ class URLValidator:
         return True, "预检通过（DNS 验证将在导航时进行）"
 
 
+@lru_cache(maxsize=4096)
+def _classify_ip(ip_str: str) -> Tuple[bool, str]:
+    """检查 IP 是否为私有/保留地址，结果只取决于 IP 字符串，按 LRU 缓存"""
+    # 常见的标准点分 IPv4 直接由 inet_pton 转为整数，不构造 ipaddress 对象
+    try:
+        ip_int = int.from_bytes(socket.inet_pton(socket.AF_INET, ip_str), 'big')
+    except (OSError, ValueError):
+        pass
+    else:
+        if ip_str in URLValidator.DANGEROUS_IPS:
+            return True, f"拒绝访问危险 IP（云服务元数据端点）: {ip_str}"
+        network = _lookup_prefix_table(URLValidator._PRIVATE_IPV4_TABLE, ip_int)
+        if network is not None:
+            return True, f"拒绝访问私有/保留 IPv4 地址: {ip_str} (属于 {network})"
+        return False, ""
+    
+    try:
+        ip = ipaddress.ip_address(ip_str)
+    except ValueError:
+        return True, f"无效的 IP 地址: {ip_str}"
+    
+    # 检查特别危险的 IP
+    if ip_str in URLValidator.DANGEROUS_IPS:
+        return True, f"拒绝访问危险 IP（云服务元数据端点）: {ip_str}"
+    
+    # 检查 IPv4
+    if isinstance(ip, ipaddress.IPv4Address):
+        network = _lookup_prefix_table(URLValidator._PRIVATE_IPV4_TABLE, int(ip))
+        if network is not None:
+            return True, f"拒绝访问私有/保留 IPv4 地址: {ip_str} (属于 {network})"
+        return False, ""
+    
+    # 检查 IPv6
+    if isinstance(ip, ipaddress.IPv6Address):
+        # 检查 IPv4-mapped IPv6 地址
+        if ip.ipv4_mapped:
+            is_private, reason = _classify_ip(str(ip.ipv4_mapped))
+            if is_private:
+                return True, f"IPv4-mapped IPv6 地址包含私有 IP: {reason}"
+        
+        network = _lookup_prefix_table(URLValidator._PRIVATE_IPV6_TABLE, int(ip))
+        if network is not None:
+            return True, f"拒绝访问私有/保留 IPv6 地址: {ip_str} (属于 {network})"
+        return False, ""
+    
+    return False, ""
+
+
 # 创建默认验证器实例
 default_validator = URLValidator()
 
@@ -1,8 +1,69 @@
+import os
 import re
+import json
 import fnmatch
+from functools import lru_cache
 from typing import List, Any, Tuple, Optional
 from astrbot.api import logger
 from astrbot.api import message_components as Comp
+from astrbot.core.agent.message import TextPart
+
+# orjson 为可选依赖，安装后用于加速较大 JSON 数据的解析
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_loads(data: str | bytes) -> Any:
+    """解析 JSON 字符串，优先使用 orjson，未安装时回退到标准库 json"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps(obj: Any) -> str:
+    """序列化为 JSON 字符串（保留非 ASCII 字符），优先使用 orjson"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False)
+
+
+# 泄露工具调用的 JSON 提取模式，支持多种格式：
+# - default_api:reply_message{...}
+# - default_api:reply_message {...}
+# - 直接 {...}
+_LEAK_JSON_PATTERNS = tuple(re.compile(p, re.DOTALL) for p in (
+    r'default_api:reply_message\s*(\{.*\})',  # 紧跟或有空格
+    r'reply_message\s*(\{.*\})',
+    r'(\{[^{}]*"content"[^{}]*"message_id"[^{}]*\})',  # 包含两个关键字段的对象
+    r'(\{[^{}]*"message_id"[^{}]*"content"[^{}]*\})',  # 顺序相反
+))
+# 修复非标准 JSON 用的模式：无引号的键名、对象/数组中的尾随逗号
+_LEAK_UNQUOTED_KEY_RE = re.compile(r'(\w+)\s*:')
+_LEAK_TRAILING_OBJ_RE = re.compile(r',\s*}')
+_LEAK_TRAILING_ARR_RE = re.compile(r',\s*]')
+# 清理泄露文本时删除的换行符
+_LEAK_STRIP_NEWLINES = str.maketrans('', '', '\r\n')
+
+# 正则回退解析泄露工具调用用的模式：带引号 / 无引号的 content 与 message_id
+_LEAK_CONTENT_RE = re.compile(r'content\s*:\s*(["\'])(.*?)\1')
+_LEAK_ID_RE = re.compile(r'message_id\s*:\s*(["\'])(.*?)\1')
+_LEAK_ID_NQ_RE = re.compile(r'message_id\s*:\s*(\d+)')
+_LEAK_CONTENT_NQ_RE = re.compile(r'content\s*:\s*([^,}]+)')
+# 未配置过滤规则时默认过滤的 &&tag&&
+_DEFAULT_TAG_FILTER_RE = re.compile(r"&&.*?&&")
+
+# 引用回复标记 [REPLY:...]
+_REPLY_MARKER_RE = re.compile(r'\[REPLY:[^\]]+\]')
+
+# OneBot 响应外层包装的典型字段，出现任一字段时才解包 data
+_ONEBOT_WRAPPER_KEYS = frozenset(("retcode", "status", "msg", "wording"))
+
+# 文本中的 [At:123456] 标记
+_AT_RE = re.compile(r"\[At:(\d+)\]")
+# At 组件后追加的空格，用 \u200b (零宽空格) 包裹，防止被 adapter strip 掉
+_AT_SPACER = "\u200b \u200b"
 
 
 def _unwrap_onebot_response(resp: Any) -> Any:
@@ -14,9 +75,8 @@ def _unwrap_onebot_response(resp: Any) -> Any:
 
     这里仅在检测到典型包装字段时才解包，避免误伤业务数据里真实存在的 'data' 字段。
     """
-    if isinstance(resp, dict) and "data" in resp:
-        if any(k in resp for k in ("retcode", "status", "msg", "wording")):
-            return resp.get("data")
+    if isinstance(resp, dict) and "data" in resp and not _ONEBOT_WRAPPER_KEYS.isdisjoint(resp):
+        return resp["data"]
     return resp
 
 
@@ -37,10 +97,13 @@ async def call_onebot(client, action: str, **kwargs) -> Any:
     Raises:
         Exception: 当所有调用方式都失败时抛出最后的异常
     """
+    # 每个方法只查找一次属性，避免 hasattr + getattr 的重复查找
+    call_action = getattr(client, 'call_action', None)
+    
     # 优先尝试 client.call_action (较新的 AstrBot 版本)
-    if hasattr(client, 'call_action') and callable(getattr(client, 'call_action', None)):
+    if callable(call_action):
         try:
-            resp = await client.call_action(action, **kwargs)
+            resp = await call_action(action, **kwargs)
             return _unwrap_onebot_response(resp)
         except AttributeError:
             # call_action 存在但调用失败，尝试 fallback
@@ -48,9 +111,10 @@ async def call_onebot(client, action: str, **kwargs) -> Any:
         except Exception as e:
             # 其他异常（如 API 本身的错误），先尝试 fallback
             # 如果 fallback 也失败，则抛出原始异常
-            if hasattr(client, 'api') and hasattr(client.api, 'call_action'):
+            api_call_action = getattr(getattr(client, 'api', None), 'call_action', None)
+            if api_call_action is not None:
                 try:
-                    resp = await client.api.call_action(action, **kwargs)
+                    resp = await api_call_action(action, **kwargs)
                     return _unwrap_onebot_response(resp)
                 except Exception:
                     # fallback 也失败，抛出原始异常
@@ -58,8 +122,9 @@ async def call_onebot(client, action: str, **kwargs) -> Any:
             raise
 
     # Fallback 到 client.api.call_action (兼容旧版本)
-    if hasattr(client, 'api') and hasattr(client.api, 'call_action'):
-        resp = await client.api.call_action(action, **kwargs)
+    api_call_action = getattr(getattr(client, 'api', None), 'call_action', None)
+    if api_call_action is not None:
+        resp = await api_call_action(action, **kwargs)
         return _unwrap_onebot_response(resp)
 
     # 两种方式都不可用
@@ -123,33 +188,51 @@ async def delete_single_message(client, message_id: str) -> str:
     logger.error(f"Failed to delete message {message_id}: {last_error}")
     raise last_error
 
+def ensure_list_content(msg) -> bool:
+    """确保 LLM 消息的 content 为列表形式，以便追加多模态组件
+
+    content 已是列表时直接返回（常见情况），为字符串时包装为 TextPart 列表。
+
+    Args:
+        msg: LLM 上下文消息对象（需具有 content 属性）
+
+    Returns:
+        bool: content 最终是否为列表
+    """
+    content = msg.content
+    if isinstance(content, list):
+        return True
+    if isinstance(content, str):
+        msg.content = [TextPart(text=content)]
+        return True
+    return False
+
 def parse_at_content(text: str) -> List[Comp.BaseMessageComponent]:
     """解析文本中的 [At:123456]"""
-    chain = []
-    pattern = r"\[At:(\d+)\]"
+    if "[At:" not in text:
+        return [Comp.Plain(text)]
     
+    chain = []
     last_end = 0
-    matches = list(re.finditer(pattern, text))
+    found = False
     
-    if not matches:
-        chain.append(Comp.Plain(text))
-        return chain
-
-    for match in matches:
+    for match in _AT_RE.finditer(text):
+        found = True
         start, end = match.span()
-        qq = match.group(1)
         
         # 添加匹配前的文本
         if start > last_end:
             chain.append(Comp.Plain(text[last_end:start]))
         
         # 添加 At 组件
-        chain.append(Comp.At(qq=qq))
-        # 使用 \u200b (零宽空格) 包裹空格，防止被 adapter strip 掉
-        chain.append(Comp.Plain("\u200b \u200b"))
+        chain.append(Comp.At(qq=match.group(1)))
+        chain.append(Comp.Plain(_AT_SPACER))
         
         last_end = end
     
+    if not found:
+        return [Comp.Plain(text)]
+    
     # 添加剩余的文本
     if last_end < len(text):
         chain.append(Comp.Plain(text[last_end:]))
@@ -158,13 +241,24 @@ def parse_at_content(text: str) -> List[Comp.BaseMessageComponent]:
 
 def get_qq_string_length(text: str) -> int:
     """计算 QQ 字符串长度 (UTF-8 字节数)"""
+    # 纯 ASCII 字符串的字节数等于字符数
+    if text.isascii():
+        return len(text)
     try:
         return len(text.encode('utf-8'))
-    except:
+    except UnicodeEncodeError:
+        # 含有无法编码的代理字符时按字符数计算
         return len(text)
 
 def truncate_qq_string(text: str, max_length: int = 60) -> str:
     """截断字符串以符合 QQ 长度限制"""
+    # 每个字符最多占 4 字节，字符数足够少时无需编码即可确定不超长
+    if len(text) * 4 <= max_length:
+        return text
+    # 纯 ASCII 字符串的字节数等于字符数，直接按字符截取
+    if text.isascii():
+        return text[:max_length]
+    
     encoded = text.encode('utf-8')
     if len(encoded) <= max_length:
         return text
@@ -186,18 +280,20 @@ def parse_leaked_tool_call(text: str, filter_patterns: List[str] = None) -> tupl
     if "default_api:reply_message" not in text:
         return None, None
     
-    # 清理文本
-    clean_text = text.replace("\n", "").replace("\r", "")
+    # 清理文本：一次删除所有换行符
+    clean_text = text.translate(_LEAK_STRIP_NEWLINES)
     # 将 <ctrl46> 替换为引号，方便解析
-    clean_text = clean_text.replace("<ctrl46>", '"')
+    if "<ctrl46>" in clean_text:
+        clean_text = clean_text.replace("<ctrl46>", '"')
     
     content = None
     message_id = None
     
-    # 策略1: 尝试 JSON 解析（优先）
-    json_result = _try_parse_as_json(clean_text)
-    if json_result:
-        content, message_id = json_result
+    # 策略1: 尝试 JSON 解析（优先），文本中没有 { 时不可能匹配任何 JSON 模式
+    if "{" in clean_text:
+        json_result = _try_parse_as_json(clean_text)
+        if json_result:
+            content, message_id = json_result
     
     # 策略2: 正则提取作为 fallback
     if content is None and message_id is None:
@@ -216,7 +312,7 @@ def parse_leaked_tool_call(text: str, filter_patterns: List[str] = None) -> tupl
                     logger.error(f"Invalid regex pattern {pattern}: {e}")
         elif filter_patterns is None:
             # 兼容旧行为，默认过滤 &&tag&&
-            content = re.sub(r"&&.*?&&", "", content)
+            content = _DEFAULT_TAG_FILTER_RE.sub("", content)
             
         content = content.strip()
         
@@ -232,23 +328,9 @@ def _try_parse_as_json(text: str) -> Optional[Tuple[str, str]]:
     Returns:
         (content, message_id) 或 None
     """
-    import json
-    
     # 尝试找到 JSON 对象的边界 { ... }
-    # 支持多种格式：
-    # - default_api:reply_message{...}
-    # - default_api:reply_message {...}
-    # - 直接 {...}
-    
-    json_patterns = [
-        r'default_api:reply_message\s*(\{.*\})',  # 紧跟或有空格
-        r'reply_message\s*(\{.*\})',
-        r'(\{[^{}]*"content"[^{}]*"message_id"[^{}]*\})',  # 包含两个关键字段的对象
-        r'(\{[^{}]*"message_id"[^{}]*"content"[^{}]*\})',  # 顺序相反
-    ]
-    
-    for pattern in json_patterns:
-        match = re.search(pattern, text, re.DOTALL)
+    for pattern in _LEAK_JSON_PATTERNS:
+        match = pattern.search(text)
         if match:
             json_str = match.group(1)
             try:
@@ -256,10 +338,10 @@ def _try_parse_as_json(text: str) -> Optional[Tuple[str, str]]:
                 # 1. 单引号替换为双引号
                 fixed_json = json_str.replace("'", '"')
                 # 2. 处理无引号的键名 (key: value -> "key": value)
-                fixed_json = re.sub(r'(\w+)\s*:', r'"\1":', fixed_json)
+                fixed_json = _LEAK_UNQUOTED_KEY_RE.sub(r'"\1":', fixed_json)
                 # 3. 移除可能的尾随逗号
-                fixed_json = re.sub(r',\s*}', '}', fixed_json)
-                fixed_json = re.sub(r',\s*]', ']', fixed_json)
+                fixed_json = _LEAK_TRAILING_OBJ_RE.sub('}', fixed_json)
+                fixed_json = _LEAK_TRAILING_ARR_RE.sub(']', fixed_json)
                 
                 obj = json.loads(fixed_json)
                 
@@ -297,8 +379,8 @@ def _parse_with_regex(text: str) -> Tuple[Optional[str], Optional[str]]:
     
     # 严格匹配引号：只使用 " 或 '，不再包含 .
     # 使用非贪婪匹配，支持引号内的内容
-    content_match = re.search(r'content\s*:\s*(["\'])(.*?)\1', text)
-    id_match = re.search(r'message_id\s*:\s*(["\'])(.*?)\1', text)
+    content_match = _LEAK_CONTENT_RE.search(text)
+    id_match = _LEAK_ID_RE.search(text)
     
     if content_match:
         content = content_match.group(2)
@@ -307,19 +389,28 @@ def _parse_with_regex(text: str) -> Tuple[Optional[str], Optional[str]]:
     
     # Fallback: 无引号情况（纯数字 message_id）
     if not message_id:
-        id_match_nq = re.search(r'message_id\s*:\s*(\d+)', text)
+        id_match_nq = _LEAK_ID_NQ_RE.search(text)
         if id_match_nq:
             message_id = id_match_nq.group(1)
     
     # Fallback: 无引号的 content（到逗号或右括号为止）
     if not content:
-        content_match_nq = re.search(r'content\s*:\s*([^,}]+)', text)
+        content_match_nq = _LEAK_CONTENT_NQ_RE.search(text)
         if content_match_nq:
             content = content_match_nq.group(1).strip().strip('"\'')
     
     return content, message_id
 
 
+@lru_cache(maxsize=32)
+def _compile_tool_patterns(patterns: Tuple[str, ...]) -> re.Pattern:
+    """将工具名通配模式合并为一个正则，语义与逐个调用 fnmatch.fnmatch 相同"""
+    if not patterns:
+        # 不匹配任何内容
+        return re.compile(r'(?!)')
+    return re.compile('|'.join(fnmatch.translate(os.path.normcase(p)) for p in patterns))
+
+
 async def check_tool_permission(
     tool_name: str,
     event,  # AstrMessageEvent
@@ -348,11 +439,9 @@ async def check_tool_permission(
         "set_essence_message", "browser_*"
     ])
     
-    is_restricted = False
-    for pattern in admin_only_tools:
-        if fnmatch.fnmatch(tool_name, pattern):
-            is_restricted = True
-            break
+    is_restricted = _compile_tool_patterns(tuple(admin_only_tools)).match(
+        os.path.normcase(tool_name)
+    ) is not None
     
     # 如果工具不在受限列表中，直接放行
     if not is_restricted:
@@ -460,4 +549,4 @@ def has_reply_markers(text: str) -> bool:
         return False
     
     # 简单的正则检查，比完整解析更高效
-    return bool(re.search(r'\[REPLY:[^\]]+\]', text))
\ No newline at end of file
+    return "[REPLY:" in text and _REPLY_MARKER_RE.search(text) is not None
\ No newline at end of file
@@ -5,21 +5,33 @@
 """
 
 import asyncio
-import json
+import bisect
 import os
+import secrets
 import time
-import uuid
-from dataclasses import dataclass, field, asdict
-from typing import Dict, List, Optional, Callable, Awaitable, TYPE_CHECKING
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple, Callable, Awaitable, TYPE_CHECKING
 
 from astrbot.api import logger
 
+from .utils import json_loads, json_dumps
+
+
+# 创建任务的合并窗口（秒）：窗口内的多次创建合并为一批加入并调度
+_CREATE_BATCH_WINDOW = 0.01
+
+# 持久化的防抖间隔（秒）：间隔内的多次修改只写入一次文件
+_SAVE_DEBOUNCE = 0.1
+
+# 同时执行的唤醒回调上限：长时间停机后大量任务同时到期时，避免并发请求模型
+_TRIGGER_CONCURRENCY = 8
+
 if TYPE_CHECKING:
     from astrbot.api.star import Context
 
 
-@dataclass
+@dataclass(slots=True)
 class WakeTask:
     """唤醒任务数据结构"""
     task_id: str
@@ -29,9 +41,31 @@ class WakeTask:
     remark: Optional[str] = None
     created_at: float = field(default_factory=time.time)
     triggered: bool = False  # 是否已触发
+    # to_dict / to_json 结果缓存；任务创建后字段基本不变，修改字段时需置为 None
+    _cached_dict: Optional[dict] = field(default=None, init=False, repr=False, compare=False)
+    _cached_json: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    # 可读触发时间与备注后缀，trigger_time / remark 创建后不变，首次显示时计算
+    _trigger_time_str: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    _remark_suffix: Optional[str] = field(default=None, init=False, repr=False, compare=False)
     
     def to_dict(self) -> dict:
-        return asdict(self)
+        if self._cached_dict is None:
+            self._cached_dict = {
+                "task_id": self.task_id,
+                "trigger_time": self.trigger_time,
+                "session_id": self.session_id,
+                "platform_id": self.platform_id,
+                "remark": self.remark,
+                "created_at": self.created_at,
+                "triggered": self.triggered,
+            }
+        return self._cached_dict
+    
+    def to_json(self) -> str:
+        """返回该任务编码后的 JSON 字符串，保存时未修改的任务无需重新编码"""
+        if self._cached_json is None:
+            self._cached_json = json_dumps(self.to_dict())
+        return self._cached_json
     
     @classmethod
     def from_dict(cls, data: dict) -> "WakeTask":
@@ -43,43 +77,80 @@ class WakeTask:
     
     def trigger_time_str(self) -> str:
         """返回可读的触发时间字符串"""
-        dt = datetime.fromtimestamp(self.trigger_time)
-        return dt.strftime("%Y-%m-%d %H:%M:%S")
+        if self._trigger_time_str is None:
+            self._trigger_time_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.trigger_time))
+        return self._trigger_time_str
     
     def format_display(self) -> str:
         """格式化显示信息"""
         remaining = int(self.remaining_seconds())
         if remaining > 0:
-            if remaining >= 3600:
-                remaining_str = f"{remaining // 3600}h{(remaining % 3600) // 60}m{remaining % 60}s"
-            elif remaining >= 60:
-                remaining_str = f"{remaining // 60}m{remaining % 60}s"
+            h, rem = divmod(remaining, 3600)
+            m, sec = divmod(rem, 60)
+            if h:
+                remaining_str = f"{h}h{m}m{sec}s"
+            elif m:
+                remaining_str = f"{m}m{sec}s"
             else:
-                remaining_str = f"{remaining}s"
+                remaining_str = f"{sec}s"
         else:
             remaining_str = "已到期"
         
-        remark_str = f" ({self.remark})" if self.remark else ""
-        return f"[{self.task_id[:8]}] {self.trigger_time_str()} (剩余 {remaining_str}){remark_str}"
+        if self._remark_suffix is None:
+            self._remark_suffix = f" ({self.remark})" if self.remark else ""
+        return f"[{self.task_id}] {self.trigger_time_str()} (剩余 {remaining_str}){self._remark_suffix}"
 
 
 class WakeScheduler:
     """唤醒任务调度器"""
     
-    def __init__(self, context: "Context", data_dir: str):
+    def __init__(self, context: "Context", data_dir: str, fsync: bool = True):
         self.context = context
         self.data_dir = data_dir
         self.data_file = os.path.join(data_dir, "wake_tasks.json")
         
+        # 保存时是否 fsync 落盘：关闭后写入更快，但断电时可能丢失最近的修改
+        self._fsync = fsync
+        
         # 任务存储：task_id -> WakeTask
         self._tasks: Dict[str, WakeTask] = {}
         
-        # 并发锁
+        # 会话索引：session_id -> {task_id}，避免按会话查询时遍历全部任务
+        self._by_session: Dict[str, Set[str]] = {}
+        
+        # 时间索引：按 (trigger_time, task_id) 有序排列的全部任务，列出任务时无需重新排序
+        self._by_time: List[Tuple[float, str]] = []
+        
+        # 终止时保存数据用的锁；其余修改之间没有 await，在事件循环中天然串行，无需加锁
         self._lock = asyncio.Lock()
         
-        # 调度任务：task_id -> asyncio.Task
+        # 限制同时执行的唤醒回调数量
+        self._trigger_sem = asyncio.Semaphore(_TRIGGER_CONCURRENCY)
+        
+        # 唯一的定时器，设置在时间索引中下一个任务的触发时间
+        self._timer_handle: Optional[asyncio.TimerHandle] = None
+        
+        # 已到期、正在触发的任务：task_id -> asyncio.Task
         self._scheduled_tasks: Dict[str, asyncio.Task] = {}
         
+        # 等待合并写入的新任务，以及负责写入的后台任务
+        self._pending_creates: List[tuple] = []
+        self._create_flush_task: Optional[asyncio.Task] = None
+        
+        # 是否有尚未写入文件的修改，以及负责延迟写入的后台任务
+        self._dirty = False
+        self._save_flush_task: Optional[asyncio.Task] = None
+        
+        # 专用的单线程 IO 线程池：文件读写彼此串行，且不与其他组件争用默认线程池
+        self._io_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='wake_io')
+        
+        # 是否已终止：终止后 IO 线程池已关闭，之后的修改（如插件卸载时完成的触发）直接同步写入
+        self._terminated = False
+        
+        # 数据版本号：每次修改递增，与最近一次成功写入时的版本相同则无需再写
+        self._version = 0
+        self._saved_version = 0
+        
         # 唤醒回调函数（由插件设置）
         self._wake_callback: Optional[Callable[[WakeTask], Awaitable[None]]] = None
         
@@ -125,26 +196,50 @@ class WakeScheduler:
         Returns:
             task_id: 任务唯一标识
         """
-        async with self._lock:
-            task_id = str(uuid.uuid4())
-            trigger_time = time.time() + delay_seconds
-            
-            task = WakeTask(
-                task_id=task_id,
-                trigger_time=trigger_time,
-                session_id=session_id,
-                platform_id=platform_id,
-                remark=remark
-            )
-            
-            self._tasks[task_id] = task
-            await self._save_tasks()
-            
-            # 调度任务
-            self._schedule_task(task)
-            
-            logger.info(f"Wake task created: {task_id} for session {session_id}, trigger at {task.trigger_time_str()}")
-            return task_id
+        # 16 位十六进制（64 bit 随机数），足以避免冲突且便于在列表中完整显示
+        task_id = secrets.token_hex(8)
+        trigger_time = time.time() + delay_seconds
+        
+        task = WakeTask(
+            task_id=task_id,
+            trigger_time=trigger_time,
+            session_id=session_id,
+            platform_id=platform_id,
+            remark=remark
+        )
+        
+        # 短时间内连续创建的任务合并为一批加入并调度，完成后返回
+        future = asyncio.get_running_loop().create_future()
+        self._pending_creates.append((task, future))
+        if self._create_flush_task is None or self._create_flush_task.done():
+            self._create_flush_task = asyncio.create_task(self._flush_creates())
+        await future
+        
+        logger.info(f"Wake task created: {task_id} for session {session_id}, trigger at {task.trigger_time_str()}")
+        return task_id
+    
+    async def _flush_creates(self):
+        """等待合并窗口结束后，将排队的新任务一次性加入并调度，持久化交给防抖写入"""
+        batch = []
+        try:
+            await asyncio.sleep(_CREATE_BATCH_WINDOW)
+            while self._pending_creates:
+                batch, self._pending_creates = self._pending_creates, []
+                for task, _ in batch:
+                    self._add_task(task)
+                self._mark_dirty()
+                self._arm_timer()
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+        except BaseException as e:
+            # 写入被取消或出错时，通知所有仍在等待的创建调用
+            exc = e if isinstance(e, Exception) else asyncio.CancelledError()
+            for _, future in batch + self._pending_creates:
+                if not future.done():
+                    future.set_exception(exc)
+            self._pending_creates = []
+            raise
     
     async def delete_task(self, task_id: str, session_id: Optional[str] = None) -> bool:
         """删除唤醒任务
@@ -156,25 +251,24 @@ class WakeScheduler:
         Returns:
             是否成功删除
         """
-        async with self._lock:
-            task = self._tasks.get(task_id)
-            if not task:
-                return False
-            
-            # 会话隔离检查
-            if session_id and task.session_id != session_id:
-                return False
-            
-            # 取消调度任务
-            if task_id in self._scheduled_tasks:
-                self._scheduled_tasks[task_id].cancel()
-                del self._scheduled_tasks[task_id]
-            
-            del self._tasks[task_id]
-            await self._save_tasks()
-            
-            logger.info(f"Wake task deleted: {task_id}")
-            return True
+        task = self._tasks.get(task_id)
+        if not task:
+            return False
+        
+        # 会话隔离检查
+        if session_id and task.session_id != session_id:
+            return False
+        
+        # 取消调度任务
+        if task_id in self._scheduled_tasks:
+            self._scheduled_tasks[task_id].cancel()
+            del self._scheduled_tasks[task_id]
+        
+        self._remove_task(task_id)
+        self._mark_dirty()
+        
+        logger.info(f"Wake task deleted: {task_id}")
+        return True
     
     async def clear_tasks(self, session_id: Optional[str] = None) -> int:
         """清空唤醒任务
@@ -185,55 +279,88 @@ class WakeScheduler:
         Returns:
             删除的任务数量
         """
-        async with self._lock:
-            if session_id:
-                # 只清空指定会话的任务
-                to_delete = [tid for tid, task in self._tasks.items() 
-                           if task.session_id == session_id and not task.triggered]
-            else:
-                # 清空所有未触发的任务
-                to_delete = [tid for tid, task in self._tasks.items() if not task.triggered]
-            
-            for task_id in to_delete:
-                if task_id in self._scheduled_tasks:
-                    self._scheduled_tasks[task_id].cancel()
-                    del self._scheduled_tasks[task_id]
-                del self._tasks[task_id]
-            
-            await self._save_tasks()
-            
-            logger.info(f"Cleared {len(to_delete)} wake tasks" + (f" for session {session_id}" if session_id else ""))
-            return len(to_delete)
+        if session_id:
+            # 只清空指定会话的任务
+            to_delete = [tid for tid in self._by_session.get(session_id, ())
+                         if not self._tasks[tid].triggered]
+        else:
+            # 清空所有未触发的任务
+            to_delete = [tid for tid, task in self._tasks.items() if not task.triggered]
+        
+        for task_id in to_delete:
+            if task_id in self._scheduled_tasks:
+                self._scheduled_tasks[task_id].cancel()
+                del self._scheduled_tasks[task_id]
+            self._remove_task(task_id)
+        
+        if to_delete:
+            self._mark_dirty()
+        
+        logger.info(f"Cleared {len(to_delete)} wake tasks" + (f" for session {session_id}" if session_id else ""))
+        return len(to_delete)
     
-    def list_tasks(self, session_id: Optional[str] = None) -> List[WakeTask]:
+    def list_tasks(self, session_id: Optional[str] = None, limit: Optional[int] = None) -> List[WakeTask]:
         """列出唤醒任务
         
         Args:
             session_id: 如果指定，只列出该会话的任务
+            limit: 如果指定，最多返回最早触发的 limit 个任务
             
         Returns:
             未触发的任务列表，按触发时间排序
         """
-        tasks = [task for task in self._tasks.values() if not task.triggered]
-        
         if session_id:
-            tasks = [task for task in tasks if task.session_id == session_id]
+            # 单个会话的任务通常很少，直接排序
+            tasks = [self._tasks[tid] for tid in self._by_session.get(session_id, ())]
+            tasks.sort(key=lambda t: t.trigger_time)
+            tasks = [task for task in tasks if not task.triggered]
+            return tasks if limit is None else tasks[:limit]
         
-        # 按触发时间排序
-        tasks.sort(key=lambda t: t.trigger_time)
+        # 时间索引已按触发时间排序，取够 limit 个即可停止
+        tasks = []
+        if limit is not None and limit <= 0:
+            return tasks
+        for _, tid in self._by_time:
+            task = self._tasks[tid]
+            if task.triggered:
+                continue
+            tasks.append(task)
+            if len(tasks) == limit:
+                break
         return tasks
     
     def get_task(self, task_id: str) -> Optional[WakeTask]:
         """获取指定任务"""
         return self._tasks.get(task_id)
     
+    def _add_task(self, task: WakeTask):
+        """将任务加入存储并更新会话索引"""
+        self._tasks[task.task_id] = task
+        self._by_session.setdefault(task.session_id, set()).add(task.task_id)
+        bisect.insort(self._by_time, (task.trigger_time, task.task_id))
+    
+    def _remove_task(self, task_id: str):
+        """从存储中移除任务并更新会话索引"""
+        task = self._tasks.pop(task_id, None)
+        if task is None:
+            return
+        ids = self._by_session.get(task.session_id)
+        if ids is not None:
+            ids.discard(task_id)
+            if not ids:
+                del self._by_session[task.session_id]
+        key = (task.trigger_time, task_id)
+        i = bisect.bisect_left(self._by_time, key)
+        if i < len(self._by_time) and self._by_time[i] == key:
+            del self._by_time[i]
+    
     def _load_tasks_sync(self) -> List[dict]:
         """同步加载任务数据（供 run_in_executor 使用）"""
         if not os.path.exists(self.data_file):
             return []
         
-        with open(self.data_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(self.data_file, 'rb') as f:
+            return json_loads(f.read())
     
     async def _load_tasks(self):
         """从文件加载任务数据（异步包装）"""
@@ -242,32 +369,63 @@ class WakeScheduler:
         
         try:
             loop = asyncio.get_running_loop()
-            data = await loop.run_in_executor(None, self._load_tasks_sync)
+            data = await loop.run_in_executor(self._io_executor, self._load_tasks_sync)
             
             for task_data in data:
                 task = WakeTask.from_dict(task_data)
                 # 只加载未触发的任务
                 if not task.triggered:
-                    self._tasks[task.task_id] = task
+                    self._add_task(task)
             
             logger.debug(f"Loaded {len(self._tasks)} wake tasks from file")
         except Exception as e:
             logger.error(f"Failed to load wake tasks: {e}")
     
-    def _save_tasks_sync(self, data: List[dict]):
-        """同步保存任务数据（供 run_in_executor 使用）"""
-        with open(self.data_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+    def _save_tasks_sync(self, content: str):
+        """同步保存任务数据（供 run_in_executor 使用），一次性写入完整内容
+        
+        先写入临时文件（启用 fsync 时先落盘），再原子替换正式文件，写入中途崩溃不会损坏已有数据。
+        """
+        payload = content.encode('utf-8')
+        tmp_file = self.data_file + ".tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(payload)
+            if self._fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_file, self.data_file)
     
     async def _save_tasks(self):
         """保存任务数据到文件（异步包装）"""
+        if self._version == self._saved_version:
+            return
         try:
-            data = [task.to_dict() for task in self._tasks.values()]
-            loop = asyncio.get_running_loop()
-            await loop.run_in_executor(None, self._save_tasks_sync, data)
+            version = self._version
+            # 逐个任务的 JSON 已缓存，这里只需拼接为数组
+            content = "[" + ",".join([task.to_json() for task in self._tasks.values()]) + "]"
+            if self._terminated:
+                self._save_tasks_sync(content)
+            else:
+                loop = asyncio.get_running_loop()
+                await loop.run_in_executor(self._io_executor, self._save_tasks_sync, content)
+            self._saved_version = version
         except Exception as e:
             logger.error(f"Failed to save wake tasks: {e}")
     
+    def _mark_dirty(self):
+        """标记任务数据已修改，在防抖间隔后统一写入文件"""
+        self._version += 1
+        self._dirty = True
+        if self._save_flush_task is None or self._save_flush_task.done():
+            self._save_flush_task = asyncio.create_task(self._flush_saves())
+    
+    async def _flush_saves(self):
+        """等待防抖间隔后写入文件，写入期间又有修改时继续下一轮"""
+        while self._dirty:
+            await asyncio.sleep(_SAVE_DEBOUNCE)
+            self._dirty = False
+            await self._save_tasks()
+    
     async def _schedule_all_pending_tasks(self):
         """调度所有待执行的任务"""
         now = time.time()
@@ -278,57 +436,70 @@ class WakeScheduler:
             if task.triggered:
                 continue
             
+            # 已到期的任务会被计时协程立即触发
             if task.trigger_time <= now:
-                # 已到期的任务：立即触发
                 expired_count += 1
-                asyncio.create_task(self._trigger_task(task))
             else:
-                # 未到期的任务：正常调度
                 scheduled_count += 1
-                self._schedule_task(task)
+        
+        self._arm_timer()
         
         if expired_count > 0:
             logger.info(f"Triggered {expired_count} expired wake tasks on startup")
         if scheduled_count > 0:
             logger.info(f"Scheduled {scheduled_count} pending wake tasks")
     
-    def _schedule_task(self, task: WakeTask):
-        """调度单个任务"""
-        delay = task.remaining_seconds()
+    def _arm_timer(self):
+        """触发所有到期任务，并将唯一的定时器设置到下一个任务的触发时间
         
-        async def delayed_trigger():
-            await asyncio.sleep(delay)
-            await self._trigger_task(task)
+        新任务加入时调用以重新计算；定时器到期时由事件循环再次调用。
+        """
+        if self._timer_handle is not None:
+            self._timer_handle.cancel()
+            self._timer_handle = None
         
-        scheduled_task = asyncio.create_task(delayed_trigger())
-        self._scheduled_tasks[task.task_id] = scheduled_task
+        loop = asyncio.get_running_loop()
+        now = time.time()
+        for trigger_time, task_id in self._by_time:
+            # 跳过已开始触发、尚未从索引中移除的任务
+            if task_id in self._scheduled_tasks:
+                continue
+            if trigger_time > now:
+                # 换算为事件循环的单调时钟，等待期间不受系统时间调整影响
+                self._timer_handle = loop.call_at(loop.time() + (trigger_time - now), self._arm_timer)
+                break
+            self._scheduled_tasks[task_id] = asyncio.create_task(
+                self._trigger_task(self._tasks[task_id])
+            )
     
     async def _trigger_task(self, task: WakeTask):
         """触发唤醒任务"""
-        async with self._lock:
-            # 检查任务是否仍然有效
-            if task.task_id not in self._tasks:
-                return
-            if task.triggered:
-                return
-            
-            # 标记为已触发
-            task.triggered = True
-            
-            # 从调度任务中移除
-            if task.task_id in self._scheduled_tasks:
-                del self._scheduled_tasks[task.task_id]
-            
-            # 从任务列表中移除
-            del self._tasks[task.task_id]
-            await self._save_tasks()
+        # 检查任务是否仍然有效
+        if task.task_id not in self._tasks:
+            return
+        if task.triggered:
+            return
+        
+        # 标记为已触发
+        task.triggered = True
+        task._cached_dict = None
+        task._cached_json = None
+        
+        # 从调度任务中移除
+        if task.task_id in self._scheduled_tasks:
+            del self._scheduled_tasks[task.task_id]
+        
+        # 从任务列表中移除
+        self._remove_task(task.task_id)
+        self._mark_dirty()
         
         logger.info(f"Triggering wake task: {task.task_id} for session {task.session_id}")
         
         # 调用唤醒回调
         if self._wake_callback:
             try:
-                await self._wake_callback(task)
+                async with self._trigger_sem:
+                    await self._wake_callback(task)
             except Exception as e:
                 logger.error(f"Failed to execute wake callback for task {task.task_id}: {e}")
         else:
@@ -336,12 +507,40 @@ class WakeScheduler:
     
     async def terminate(self):
         """终止调度器，取消所有调度任务"""
+        # 先完成排队中的任务创建，避免其丢失
+        if self._create_flush_task and not self._create_flush_task.done():
+            try:
+                await self._create_flush_task
+            except Exception as e:
+                logger.debug(f"Error flushing pending wake tasks: {e}")
+        
+        # 等待进行中的延迟写入结束，避免与下面的最终保存同时写文件
+        if self._save_flush_task and not self._save_flush_task.done():
+            try:
+                await self._save_flush_task
+            except Exception as e:
+                logger.debug(f"Error flushing wake task saves: {e}")
+        
         async with self._lock:
-            for task in self._scheduled_tasks.values():
-                task.cancel()
+            if self._timer_handle is not None:
+                self._timer_handle.cancel()
+                self._timer_handle = None
+            pending = list(self._scheduled_tasks.values())
             self._scheduled_tasks.clear()
+            # 在保存前取消，避免尚未开始的触发任务在下面等待写入时开始执行
+            for task in pending:
+                task.cancel()
             
-            # 保存当前状态
+            # 保存当前状态（自上次写入后没有修改时直接跳过）
+            self._dirty = False
             await self._save_tasks()
         
+        # 在锁外等待被取消的触发任务结束，确保退出时没有遗留的任务
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        
+        # 之后的保存改为同步写入；关闭线程池时等待仍在进行的写入完成，避免丢失
+        self._terminated = True
+        self._io_executor.shutdown(wait=True)
+        
         logger.info("WakeScheduler terminated")
\ No newline at end of file